@@ -2,34 +2,73 @@
 # ai_service.py - Gemini API 호출 관련 함수
 
 import google.generativeai.types as genai_types
+import random
 import re
 import traceback
 
 import config
 import prompts
+from api_guard import CircuitOpenError, call_model, is_degraded
+from sentiment_batcher import classify_sentiment_single, get_sentiment_batcher
 
-async def generate_response(model, user_message, current_history, current_likability):
-    """사용자 메시지에 대한 응답 생성"""
+# 답변 요청당 프롬프트 토큰 수 통계 (페르소나 방식별: 'persona_variant' / 'context_turn')
+prompt_token_stats = {}
+
+def record_prompt_tokens(mode, response):
+    """응답의 usage_metadata 에서 프롬프트 토큰 수를 읽어 방식별로 누적 및 출력"""
+    prompt_tokens = getattr(getattr(response, 'usage_metadata', None), 'prompt_token_count', None)
+    if prompt_tokens is None:
+        return
+    stats = prompt_token_stats.setdefault(mode, {'count': 0, 'total': 0})
+    stats['count'] += 1
+    stats['total'] += prompt_tokens
+    print(f"DEBUG: 프롬프트 토큰 ({mode}) - 이번 요청 {prompt_tokens}, 평균 {stats['total'] / stats['count']:.0f} ({stats['count']}회)")
+
+def _build_generation_config(generation_config):
+    """라우터가 고른 generation_config dict 를 GenerationConfig 로 변환 (None 이면 기본값 사용)"""
+    return genai_types.GenerationConfig(**generation_config) if generation_config else None
+
+async def generate_response(router, user_message, current_history, current_likability, memory_snippets=None):
+    """사용자 메시지에 대한 응답 생성 (memory_snippets: 장기 기억에서 찾은 관련 예전 대화)"""
     print("DEBUG: generate_response - 1단계: 전체 응답 생성 시도...")
+    if config.PERSONA_VARIANTS_ENABLED:
+        # 현재 호감도 구간의 말투 규칙만 들어간 페르소나 모델 사용 (호감도 컨텍스트 턴 불필요)
+        persona_mode = "persona_variant"
+        persona_band = prompts.get_likability_band(current_likability)
+    else:
+        persona_mode = "context_turn"
+        persona_band = None
+    model, generation_config = router.select("reply", persona_band=persona_band)
     
     # API 요청을 위한 히스토리 준비
     history_for_api = current_history.copy()
+    
+    # 장기 기억 컨텍스트 추가 (잘려나간 예전 대화 중 관련 내용)
+    if memory_snippets:
+        memory_context_prompt = prompts.LONG_TERM_MEMORY_CONTEXT_TEMPLATE.format(
+            memory_snippets="\n".join(f"- {snippet}" for snippet in memory_snippets))
+        history_for_api.append({'role': 'user', 'parts': [memory_context_prompt]})
+    
     history_for_api.append({'role': 'user', 'parts': [user_message]})
     
-    # 호감도 컨텍스트 추가
-    likability_percent = f"{current_likability}%"
-    likability_context_prompt = f"(시스템 컨텍스트: 참고로 현재 이 사용자와 나의 호감도는 {likability_percent} 야. 이 호감도 %와 나의 역할 설정(System Instruction)에 명시된 기준에 따라 말투와 태도를 엄격하게 조절해서 응답해야 해. 호감도 점수 자체를 언급하지는 마.)"
-    history_for_api.append({'role': 'user', 'parts': [likability_context_prompt]})
+    # 호감도 컨텍스트 추가 (전체 구간 페르소나를 쓸 때만)
+    if persona_mode == "context_turn":
+        likability_percent = f"{current_likability}%"
+        likability_context_prompt = f"(시스템 컨텍스트: 참고로 현재 이 사용자와 나의 호감도는 {likability_percent} 야. 이 호감도 %와 나의 역할 설정(System Instruction)에 명시된 기준에 따라 말투와 태도를 엄격하게 조절해서 응답해야 해. 호감도 점수 자체를 언급하지는 마.)"
+        history_for_api.append({'role': 'user', 'parts': [likability_context_prompt]})
     
     try:
         # Gemini API 호출
-        response = await model.generate_content_async(
+        response = await call_model(
+            model,
             history_for_api,
-            generation_config=None  # 또는 config에서 가져온 설정
+            generation_config=_build_generation_config(generation_config),
+            task="reply"
         )
         
         if not (response and response.text):
             raise Exception("Initial generation failed or blocked")
+        record_prompt_tokens(persona_mode, response)
         
         bot_response_text_full = response.text.strip()
         print(f"DEBUG: generate_response - 1단계 생성 전체 응답: {bot_response_text_full[:100]}...")
@@ -38,7 +77,7 @@ async def generate_response(model, user_message, current_history, current_likabi
         sentences = re.split(r'(?<=[.?!])\s+', bot_response_text_full)
         if len(sentences) > 3:
             print(f"DEBUG: 답변이 {len(sentences)} 문장으로 길어서 요약 시도...")
-            summarized_text = await summarize_text(model, bot_response_text_full)
+            summarized_text = await summarize_text(router, bot_response_text_full, persona_band)
             if summarized_text:
                 final_text_to_send = summarized_text
             else:
@@ -50,28 +89,35 @@ async def generate_response(model, user_message, current_history, current_likabi
         
         return bot_response_text_full, final_text_to_send
         
+    except CircuitOpenError as e:
+        # API 장애 중에는 기다리지 않고 바로 기본 답변 사용
+        print(f"경고: API 장애 상태라 기본 답변 사용 - {e}")
+        canned_reply = random.choice(prompts.DEGRADED_REPLY_FALLBACKS)
+        return canned_reply, canned_reply
     except Exception as e:
         print(f"오류: 응답 생성 중 예외 발생 - {e}")
         traceback.print_exc()
         return "미안, 지금은 말을 잘 못하겠어... 😥", "미안, 지금은 말을 잘 못하겠어... 😥"
 
-async def calculate_likability(model, current_score, message_content):
+async def calculate_likability(router, current_score, message_content):
     """메시지 감정 분석을 통한 호감도 계산"""
     print(f"DEBUG: calculate_likability 호출됨 - 현재 점수: {current_score}, 메시지: '{message_content[:20]}...'")
     new_score = current_score
+    model, generation_config = router.select("sentiment")
+    
+    if is_degraded(model):
+        # API 장애 중에는 감성 분석을 건너뛰고 호감도 유지
+        print(f"경고: API 장애 상태라 감성 분석 생략. 호감도 변경 없음.")
+        return current_score
     
     try:
-        generation_config_sentiment = genai_types.GenerationConfig(**config.SENTIMENT_GENERATION_CONFIG)
-        sentiment_prompt = prompts.SENTIMENT_ANALYSIS_PROMPT_TEMPLATE.format(user_message=message_content)
-        print(f"DEBUG: 감성 분석 프롬프트 전송 시도")
-        
-        sentiment_response = await model.generate_content_async(
-            sentiment_prompt, 
-            generation_config=generation_config_sentiment
-        )
+        if config.SENTIMENT_MICRO_BATCH_ENABLED:
+            # 다른 사용자들의 요청과 묶어서 한 번에 분류
+            sentiment = await get_sentiment_batcher(model, generation_config).classify(message_content)
+        else:
+            sentiment = await classify_sentiment_single(model, message_content, generation_config)
         
-        if sentiment_response and sentiment_response.text:
-            sentiment = sentiment_response.text.strip().upper()
+        if sentiment:
             print(f"DEBUG: 감성 분석 결과: {sentiment}")
             
             if sentiment == "POSITIVE":
@@ -83,7 +129,7 @@ async def calculate_likability(model, current_score, message_content):
             else:
                 print(f"DEBUG: 호감도 변경 없음 (감성: {sentiment})")
         else:
-            print(f"경고: 감성 분석 API 응답 비었음. 호감도 변경 없음.")
+            print(f"경고: 감성 분석 결과 없음. 호감도 변경 없음.")
     except Exception as e:
         print(f"오류: 감성 분석 API 호출 중 오류 발생: {e}")
         traceback.print_exc()
@@ -94,17 +140,20 @@ async def calculate_likability(model, current_score, message_content):
     
     return new_score
 
-async def summarize_text(model, text_to_summarize):
-    """긴 텍스트 요약"""
+async def summarize_text(router, text_to_summarize, persona_band=None):
+    """긴 텍스트 요약 (persona_band: 원문을 생성할 때 쓴 호감도 구간, 같은 말투 규칙으로 요약하도록)"""
     print(f"DEBUG: summarize_text 호출됨 - 요약 대상 (시작): '{text_to_summarize[:50]}...'")
     
     try:
         summary_prompt = prompts.SUMMARIZE_PROMPT_TEMPLATE.format(text_to_summarize=text_to_summarize)
-        generation_config_summary = genai_types.GenerationConfig(**config.SUMMARY_GENERATION_CONFIG)
+        model, generation_config = router.select("summary", persona_band=persona_band)
+        generation_config_summary = _build_generation_config(generation_config)
         
-        summary_response = await model.generate_content_async(
+        summary_response = await call_model(
+            model,
             summary_prompt, 
-            generation_config=generation_config_summary
+            generation_config=generation_config_summary,
+            task="summary"
         )
         
         if summary_response and summary_response.text:
@@ -119,7 +168,7 @@ async def summarize_text(model, text_to_summarize):
         traceback.print_exc()
         return None
 
-async def generate_proactive_message(model, user_id, user_display_name):
+async def generate_proactive_message(router, user_id, user_display_name):
     """선톡 메시지 생성"""
     # 사용자 데이터 로드
     current_history, current_likability = load_user_data(user_id)
@@ -132,10 +181,13 @@ async def generate_proactive_message(model, user_id, user_display_name):
     
     try:
         # Gemini API 호출
-        generation_config = genai_types.GenerationConfig(**config.DEFAULT_GENERATION_CONFIG) if config.DEFAULT_GENERATION_CONFIG else None
-        response = await model.generate_content_async(
+        persona_band = prompts.get_likability_band(current_likability) if config.PERSONA_VARIANTS_ENABLED else None
+        model, generation_config = router.select("proactive", persona_band=persona_band)
+        response = await call_model(
+            model,
             history_with_instruction, 
-            generation_config=generation_config
+            generation_config=_build_generation_config(generation_config),
+            task="proactive"
         )
         
         if response and response.text:
@@ -146,7 +198,7 @@ async def generate_proactive_message(model, user_id, user_display_name):
             sentences = re.split(r'(?<=[.?!])\s+', generated_text)
             if len(sentences) > config.SUMMARY_MAX_SENTENCES:
                 print(f"DEBUG: 선톡 - 답변이 {len(sentences)} 문장으로 길어서 요약 시도...")
-                summarized_text = await summarize_text(model, generated_text)
+                summarized_text = await summarize_text(router, generated_text, persona_band)
                 if summarized_text:
                     final_text = summarized_text
                 else:
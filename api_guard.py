@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# api_guard.py - Gemini API 호출 꼬리 지연(tail latency) 제어
+# 시도별/호출 전체 제한 시간, p95 초과 시 중복(hedged) 요청, 지터가 들어간 제한적 재시도, 서킷 브레이커
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+from google.api_core import exceptions as core_exceptions
+
+import config
+
+# 재시도해볼 만한 일시적 오류 (그 외 오류는 바로 호출한 쪽으로 전달)
+RETRYABLE_EXCEPTIONS = (
+    asyncio.TimeoutError,
+    core_exceptions.DeadlineExceeded,
+    core_exceptions.InternalServerError,
+    core_exceptions.ResourceExhausted,
+    core_exceptions.ServiceUnavailable,
+    core_exceptions.TooManyRequests,
+)
+
+class CircuitOpenError(Exception):
+    """서킷 브레이커가 열려 있어서 API 를 호출하지 않고 바로 실패함"""
+
+def get_model_name(model):
+    return getattr(model, 'model_name', None) or repr(model)
+
+class ModelStats:
+    """작업·모델별 최근 호출 지연시간/오류율 (최근 MODEL_STATS_WINDOW 회 기준)
+
+    같은 모델이라도 답변 생성과 감성 분석은 지연시간 분포가 전혀 다르므로 작업별로 따로 모음.
+    """
+
+    def __init__(self, window=None):
+        window = window or config.MODEL_STATS_WINDOW
+        self.latencies = deque(maxlen=window)  # 성공한 호출의 지연시간 (초)
+        self.outcomes = deque(maxlen=window)  # (기록 시각, 성공 True / 실패 False)
+        self.hedges = 0
+
+    def record_success(self, elapsed):
+        self.latencies.append(elapsed)
+        self.outcomes.append((time.monotonic(), True))
+
+    def record_failure(self):
+        self.outcomes.append((time.monotonic(), False))
+
+    def recent_outcomes(self, max_age=None):
+        """최근 max_age 초 안의 성공/실패 기록 (max_age 가 None 이면 전체)"""
+        cutoff = None if max_age is None else time.monotonic() - max_age
+        return [ok for recorded_at, ok in self.outcomes if cutoff is None or recorded_at >= cutoff]
+
+    def percentile(self, q):
+        """성공 호출 지연시간의 q 분위수 (표본이 없으면 None)"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def error_rate(self, max_age=None):
+        outcomes = self.recent_outcomes(max_age)
+        if not outcomes:
+            return 0.0
+        return outcomes.count(False) / len(outcomes)
+
+class CircuitBreaker:
+    """연속 실패가 threshold 회 이상이면 열림(open) -> reset_seconds 후 시험 호출 1회 허용(half-open)"""
+
+    def __init__(self, name, failure_threshold=None, reset_seconds=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        self.reset_seconds = config.CIRCUIT_BREAKER_RESET_SECONDS if reset_seconds is None else reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def is_open(self):
+        """지금 호출하면 바로 거절될 상태인지 (시험 호출 기회는 소모하지 않음)"""
+        if self.state == "open":
+            return time.monotonic() - self.opened_at < self.reset_seconds
+        return self.state == "half_open" and self._probe_in_flight
+
+    def allow_request(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = "half_open"
+            print(f"DEBUG: 서킷 브레이커 half-open - {self.name}, 시험 호출 허용")
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def release_probe(self):
+        """시험 호출이 결과 없이 취소됐을 때 다음 호출이 다시 시험할 수 있도록 함"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != "closed":
+            print(f"DEBUG: 서킷 브레이커 닫힘 (API 정상화) - {self.name}")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"경고: 서킷 브레이커 열림 - {self.name}, 연속 실패 {self.consecutive_failures}회. {self.reset_seconds}초 동안 호출 중단.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+_model_stats: Dict[Tuple[str, str], ModelStats] = {}  # (작업, 모델 이름) -> 통계
+_breakers: Dict[str, CircuitBreaker] = {}  # 모델 이름 -> 서킷 (API 장애는 작업과 무관하므로 모델 단위)
+
+def get_model_stats(model, task="reply"):
+    key = (task, get_model_name(model))
+    if key not in _model_stats:
+        _model_stats[key] = ModelStats()
+    return _model_stats[key]
+
+def get_breaker(model):
+    name = get_model_name(model)
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+def is_degraded(model):
+    """모델 API 가 장애 상태(서킷 열림)인지"""
+    return get_breaker(model).is_open()
+
+async def _attempt_with_hedge(model, contents, generation_config, timeout, stats):
+    """한 번의 시도: timeout 안에 응답이 없으면 TimeoutError.
+    p95 지연시간이 지나도 응답이 없으면 같은 요청을 하나 더 보내고 먼저 성공한 쪽을 사용"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    tasks = {asyncio.create_task(model.generate_content_async(contents, generation_config=generation_config))}
+
+    hedge_delay = None
+    if config.API_HEDGING_ENABLED and len(stats.latencies) >= config.API_HEDGE_MIN_SAMPLES:
+        hedge_delay = stats.percentile(config.API_HEDGE_PERCENTILE)
+
+    last_error = None
+    try:
+        if hedge_delay is not None and hedge_delay < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                stats.hedges += 1
+                print(f"DEBUG: 응답 지연 ({hedge_delay:.2f}초 초과) - {get_model_name(model)} 중복 요청 전송")
+                tasks.add(asyncio.create_task(model.generate_content_async(contents, generation_config=generation_config)))
+        while tasks:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            done, _ = await asyncio.wait(tasks, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for task in done:
+                tasks.discard(task)
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def call_model(model, contents, generation_config=None, task="reply"):
+    """generate_content_async 를 제한 시간/중복 요청/재시도/서킷 브레이커로 감싸서 호출
+
+    task: 'reply', 'sentiment', 'summary', 'proactive' (제한 시간 설정 및 지연시간 통계 구분용)
+    재시도를 포함한 전체 소요 시간은 API_CALL_DEADLINE_SECONDS[task] 를 넘지 않음 (남은 시간만큼만 시도).
+    서킷이 열려 있으면 API 를 호출하지 않고 CircuitOpenError 를 바로 발생시킴.
+    """
+    breaker = get_breaker(model)
+    stats = get_model_stats(model, task)
+    timeout = config.API_CALL_TIMEOUT_SECONDS.get(task, config.API_CALL_TIMEOUT_SECONDS["reply"])
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.API_CALL_DEADLINE_SECONDS.get(task, config.API_CALL_DEADLINE_SECONDS["reply"])
+
+    last_error = None
+    for attempt in range(config.API_MAX_RETRIES + 1):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            print(f"경고: {task} API 호출 전체 제한 시간 초과 - {attempt}회 시도 후 포기")
+            break
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"{breaker.name} 서킷 열림 ({task} 호출 생략)") from last_error
+        start = time.perf_counter()
+        try:
+            response = await _attempt_with_hedge(model, contents, generation_config, min(timeout, remaining), stats)
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        except RETRYABLE_EXCEPTIONS as e:
+            stats.record_failure()
+            breaker.record_failure()
+            last_error = e
+            print(f"경고: {task} API 호출 실패 ({attempt + 1}/{config.API_MAX_RETRIES + 1}회) - {type(e).__name__}: {e}")
+            if attempt < config.API_MAX_RETRIES:
+                # 지수 백오프 + full jitter (전체 제한 시간을 넘겨서 기다리지는 않음)
+                backoff = min(config.API_RETRY_MAX_DELAY_SECONDS, config.API_RETRY_BASE_DELAY_SECONDS * (2 ** attempt))
+                await asyncio.sleep(min(random.uniform(0, backoff), max(0.0, deadline - loop.time())))
+            continue
+        except Exception:
+            # 요청 자체가 잘못된 경우 등은 재시도 대상이 아님 (API 는 응답했으므로 서킷에는 장애로 기록하지 않음)
+            stats.record_failure()
+            breaker.record_success()
+            raise
+        stats.record_success(time.perf_counter() - start)
+        breaker.record_success()
+        return response
+    raise last_error or asyncio.TimeoutError()
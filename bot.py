@@ -14,6 +14,7 @@ from database import init_db
 import prompts
 import config
 from message_handler import handle_new_message
+from model_router import ModelRouter
 from utils import send_proactive_message
 
 # --- .env 로드 및 변수 설정 ---
@@ -40,13 +41,11 @@ except ValueError:
 try:
     genai.configure(api_key=GEMINI_API_KEY)
     print(f"시스템 프롬프트 로드됨 (일부): {prompts.SYSTEM_INSTRUCTION[:100]}...")
-    SELECTED_MODEL = 'gemini-1.5-flash-latest'
     
-    model = genai.GenerativeModel(
-        SELECTED_MODEL,
-        system_instruction=prompts.SYSTEM_INSTRUCTION
-    )
-    print(f"Gemini API 설정 및 모델({model.model_name}) 초기화 완료.")
+    # 작업별 모델은 config.MODEL_REGISTRY 에서 설정
+    model_router = ModelRouter()
+    model_router.warm_up()
+    print(f"Gemini API 설정 및 작업별 모델 초기화 완료.")
 except Exception as e: 
     print(f"Gemini API 설정 또는 모델 초기화 중 오류 발생: {e}")
     exit()
@@ -55,7 +54,7 @@ except Exception as e:
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
-bot.model = model  # 모델 인스턴스를 봇 객체에 저장
+bot.model_router = model_router  # 작업별 모델 선택기를 봇 객체에 저장
 
 # --- 봇 이벤트 핸들러 ---
 @bot.event
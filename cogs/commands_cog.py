@@ -5,6 +5,7 @@ import discord
 from discord.ext import commands
 # --- !!! database 에서 load_user_data 를 가져오도록 수정 !!! ---
 from database import load_user_data, save_user_data # <-- save_user_data 추가
+from message_handler import wait_for_post_processing
 
 class CommandsCog(commands.Cog):
     def __init__(self, bot):
@@ -92,6 +93,9 @@ class CommandsCog(commands.Cog):
         print(f"DEBUG: !호감도변경 명령어 실행 - 사용자 ID: {user_id}, 목표 점수: {new_score}")
 
         try:
+            # 진행 중인 대화 묶음의 저장이 끝난 뒤에 변경 (나중에 끝난 저장이 새 점수를 덮어쓰지 않도록)
+            await wait_for_post_processing(user_id)
+
             # 현재 대화 기록을 불러옴 (호감도만 변경하고 기록은 유지하기 위해)
             current_history, _ = load_user_data(user_id)
 
@@ -22,4 +22,85 @@ SUMMARY_MAX_SENTENCES = 5
 DEFAULT_GENERATION_CONFIG = None
 # 예시: DEFAULT_GENERATION_CONFIG = {"max_output_tokens": 250} # 또는 None
 SENTIMENT_GENERATION_CONFIG = {"max_output_tokens": 50, "temperature": 0.2}
-SUMMARY_GENERATION_CONFIG = {"max_output_tokens": 200}
\ No newline at end of file
+SUMMARY_GENERATION_CONFIG = {"max_output_tokens": 200}
+
+# --- 저장소(DB) 관련 설정 ---
+# 'postgres' : DATABASE_URL 의 원격 PostgreSQL 사용 (기존 방식)
+# 'sqlite'   : 단일 서버용 내장 SQLite 파일 사용 (WAL 모드, 네트워크 왕복 없음)
+STORAGE_BACKEND = "postgres"
+SQLITE_DB_PATH = "leeep_bot.sqlite3" # SQLite 사용 시 DB 파일 경로
+
+# --- 감성 분석 마이크로 배치 설정 ---
+# 여러 사용자의 감성 분석 요청을 잠깐 모아서 한 번의 API 요청으로 분류 (요청 수/쿼터 절약)
+SENTIMENT_MICRO_BATCH_ENABLED = True
+SENTIMENT_BATCH_MAX_WAIT_SECONDS = 0.3 # 첫 요청 후 최대 대기 시간 (초)
+SENTIMENT_BATCH_MAX_ITEMS = 16 # 이 개수가 모이면 대기 없이 바로 전송
+SENTIMENT_BATCH_TOKENS_PER_ITEM = 8 # 배치 요청 시 항목당 허용할 출력 토큰 수
+
+# --- 장기 기억(long-term memory) 관련 설정 ---
+# trim_history 로 잘려나간 예전 대화를 사용자별로 기억해두고, 답변 생성 시 관련 내용만 찾아서 넣어줌
+LONG_TERM_MEMORY_ENABLED = True
+HISTORY_MAX_TURNS = 10 # 프롬프트에 그대로 넣는 최근 대화 턴 수 (사용자/봇 메시지 쌍 기준)
+MEMORY_TOP_K = 3 # 답변 생성 시 넣어줄 관련 기억 최대 개수
+MEMORY_MIN_SCORE = 0.2 # 이 유사도(코사인) 미만인 기억은 넣지 않음
+# 벡터 메모리 = 차원 x 보관 개수 x 2바이트(float16) = 사용자당 최대 약 2MB, 캐시 상한까지 약 64MB
+MEMORY_FEATURE_DIM = 512 # 해시 특징 벡터 차원
+MEMORY_NGRAM_SIZES = (2, 3) # 문자 n-gram 크기
+MEMORY_MAX_SNIPPETS_PER_USER = 2000 # 사용자별 최대 보관 개수 (넘으면 오래된 것부터 삭제)
+MEMORY_STORE_DIR = "memory_store" # 기억 파일(텍스트 .jsonl + 벡터 .f16) 저장 폴더 (None 이면 메모리에만 보관)
+MEMORY_MAX_CACHED_USERS = 32 # 메모리에 올려둘 최대 사용자 수 (넘으면 가장 오래 안 쓴 사용자부터 내림, 메모리 전용 모드면 그 기억은 삭제됨)
+MEMORY_IDLE_EVICT_SECONDS = 30 * 60 # 이 시간 동안 안 쓴 사용자의 인덱스는 메모리에서 내림 (파일에서 다시 로드)
+
+# --- 추측(speculative) 답변 생성 설정 ---
+# 메시지가 올 때마다 대기 시간(MESSAGE_BATCH_DELAY_SECONDS) 동안 미리 답변을 생성해두고,
+# 추가 메시지가 오면 버리고 다시 생성, 대기 시간이 끝나면 미리 만든 답변을 바로 사용
+SPECULATIVE_REPLY_ENABLED = False
+
+# --- 답변 처리 파이프라인 설정 ---
+# True : 답변 생성 직후 바로 전송하고, 호감도 계산/DB 저장은 사용자별 순서를 지켜 백그라운드에서 진행
+# False: 기존처럼 호감도 계산과 저장까지 끝난 뒤 전송 (지연시간 비교용)
+BACKGROUND_POST_PROCESSING_ENABLED = True
+
+# --- API 호출 지연/장애 대응 설정 (api_guard.py) ---
+# 작업별 1회 시도당 제한 시간 (초)
+API_CALL_TIMEOUT_SECONDS = {"reply": 25, "sentiment": 8, "summary": 12, "proactive": 25}
+# 작업별 호출 1건의 전체 제한 시간 (초, 재시도와 대기 포함). 답변+요약이 typing 표시를 붙잡는 최대 시간도 이걸로 제한됨
+API_CALL_DEADLINE_SECONDS = {"reply": 30, "sentiment": 10, "summary": 12, "proactive": 30}
+API_MAX_RETRIES = 2 # 일시적 오류/시간 초과 시 추가 재시도 횟수
+API_RETRY_BASE_DELAY_SECONDS = 0.5 # 재시도 대기 기본값 (지수 증가 + 지터)
+API_RETRY_MAX_DELAY_SECONDS = 4
+API_HEDGING_ENABLED = True # 응답이 느리면 같은 요청을 하나 더 보내서 먼저 온 응답 사용
+API_HEDGE_PERCENTILE = 0.95 # 최근 지연시간의 이 분위수를 넘으면 중복 요청
+API_HEDGE_MIN_SAMPLES = 20 # 이만큼 표본이 쌓이기 전에는 중복 요청 안 함
+MODEL_STATS_WINDOW = 100 # 작업·모델별 지연시간/오류율 계산에 쓰는 최근 호출 수
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5 # 연속 실패가 이만큼이면 호출 중단 (서킷 열림)
+CIRCUIT_BREAKER_RESET_SECONDS = 30 # 서킷이 열린 뒤 시험 호출까지 대기 시간
+
+# --- 작업별 모델 라우팅 설정 (model_router.py) ---
+# 작업별로 사용할 수 있는 모델 목록. 그 중 최근 지연시간이 가장 짧고 정상인 모델을 사용
+# system_instruction: 페르소나(prompts.SYSTEM_INSTRUCTION) 포함 여부 (감성 분석처럼 필요 없는 작업은 False 로 토큰 절약)
+MODEL_REGISTRY = {
+    "reply": [
+        {"model": "gemini-1.5-flash-latest", "generation_config": DEFAULT_GENERATION_CONFIG, "system_instruction": True},
+    ],
+    "proactive": [
+        {"model": "gemini-1.5-flash-latest", "generation_config": DEFAULT_GENERATION_CONFIG, "system_instruction": True},
+    ],
+    "sentiment": [
+        {"model": "gemini-1.5-flash-8b", "generation_config": SENTIMENT_GENERATION_CONFIG, "system_instruction": False},
+        {"model": "gemini-1.5-flash-latest", "generation_config": SENTIMENT_GENERATION_CONFIG, "system_instruction": False},
+    ],
+    "summary": [
+        {"model": "gemini-1.5-flash-8b", "generation_config": SUMMARY_GENERATION_CONFIG, "system_instruction": True},
+        {"model": "gemini-1.5-flash-latest", "generation_config": SUMMARY_GENERATION_CONFIG, "system_instruction": True},
+    ],
+}
+MODEL_ROUTER_MIN_SAMPLES = 5 # 이만큼 표본이 쌓이기 전까지는 설정 순서대로 사용 (지연시간 비교 안 함)
+MODEL_ROUTER_MAX_ERROR_RATE = 0.3 # 최근 오류율이 이보다 높은 모델은 후보에서 제외
+MODEL_ROUTER_ERROR_WINDOW_SECONDS = 300 # 오류율은 이 시간 안의 호출만으로 계산 (제외된 모델도 실패 기록이 오래되면 다시 시도)
+MODEL_ROUTER_EXPLORE_RATE = 0.05 # 가끔 다른 후보도 사용해서 지연시간 통계를 최신으로 유지
+
+# --- 페르소나 설정 ---
+# True : 호감도 구간별로 해당 구간 말투 규칙만 들어간 페르소나 모델을 사용 (프롬프트가 짧아짐)
+# False: 전체 구간 규칙이 들어간 페르소나 + 매 요청마다 호감도 컨텍스트 턴 추가 (기존 방식, 토큰 비교용)
+PERSONA_VARIANTS_ENABLED = True
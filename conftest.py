@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+# conftest.py - 저장소 루트를 sys.path 에 올려서 tests/ 에서 최상위 모듈(database, config ...)을 임포트할 수 있게 함
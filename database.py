@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
 # database.py (config.py 사용하도록 수정)
+# 저장소 백엔드(PostgreSQL / 내장 SQLite)를 선택해서 사용하는 저장 계층.
+# 외부에서는 기존과 동일하게 init_db / load_user_data / save_user_data / get_all_user_ids 만 사용.
 
-import psycopg2
 import json
 import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
 import config # <-- config.py 임포트 추가
 
+try:
+    import psycopg2
+except ImportError: # SQLite 만 쓰는 단일 서버 배포에서는 psycopg2 가 없어도 동작하도록
+    psycopg2 = None
+
 # --- !!! DEFAULT_LIKABILITY 정의 삭제 !!! ---
 # 삭제 --> DEFAULT_LIKABILITY = 50
 # ---------------------------------------
@@ -13,113 +24,331 @@ import config # <-- config.py 임포트 추가
 # .env 에서 DB 접속 정보 읽기
 DATABASE_URL = os.getenv('DATABASE_URL')
 
-def get_db_connection():
-    """데이터베이스 커넥션을 생성하고 반환합니다."""
-    # print(f"DEBUG: get_db_connection 함수 호출됨.") # 필요 시 주석 해제
-    db_url = os.getenv('DATABASE_URL') # 함수 내부에서 읽기
-    if not db_url:
-         print("오류: DATABASE_URL 환경 변수를 찾을 수 없습니다! (.env 파일 또는 Replit Secrets 확인)")
-         return None
-    try:
-        # print(f"DEBUG: psycopg2.connect 시도: URL='{db_url}'")
-        conn = psycopg2.connect(db_url)
-        # print("DEBUG: psycopg2.connect 성공!")
-        return conn
-    except psycopg2.Error as e:
-        print(f"데이터베이스 연결 오류: {e}")
-        # print(f"DEBUG: 연결 실패 시 사용된 DATABASE_URL: '{db_url}'")
-        return None
+def _parse_history_json(user_id, history_json):
+    """저장된 history JSON 문자열을 리스트로 변환 (파싱 실패 시 빈 리스트)"""
+    try: return json.loads(history_json or '[]')
+    except json.JSONDecodeError: print(f"경고: 사용자 {user_id}의 history JSON 파싱 오류. 빈 리스트 반환."); return []
 
-def init_db():
-    """데이터베이스와 테이블 초기화 (없으면 생성, 있으면 likability 컬럼 추가 시도)"""
-    conn = get_db_connection()
-    if conn is None: return
-    try:
-        with conn:
-            with conn.cursor() as cursor:
-                # 기본값을 config 에서 가져옴
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS conversations (
-                        user_id BIGINT PRIMARY KEY,
-                        history TEXT,
-                        likability INTEGER DEFAULT %s
-                    )
-                ''', (config.DEFAULT_LIKABILITY_SCORE,)) # <-- config 사용
-                print("테이블 'conversations' 확인/생성 완료.")
-                try:
+class StorageBackend(ABC):
+    """저장소 백엔드 공통 인터페이스. 모든 백엔드는 아래 메서드들을 같은 의미로 구현해야 함."""
+    name = "base"
+
+    @abstractmethod
+    def init_db(self):
+        """테이블 초기화 (없으면 생성)"""
+
+    @abstractmethod
+    def load_user_data(self, user_id):
+        """(history_list, likability) 반환. 기록이 없거나 오류 시 ([], 기본 호감도)"""
+
+    @abstractmethod
+    def save_user_data(self, user_id, history_list, likability_score):
+        """기록과 호감도를 덮어쓰기 저장 (upsert)"""
+
+    @abstractmethod
+    def get_all_user_ids(self):
+        """저장된 모든 사용자 ID 리스트 반환 (오류 시 빈 리스트)"""
+
+    @abstractmethod
+    def delete_user_data(self, user_id):
+        """특정 사용자의 저장 데이터 삭제 (점검/벤치마크 데이터 정리용)"""
+
+class PostgresStorage(StorageBackend):
+    """DATABASE_URL 의 원격 PostgreSQL 을 사용하는 백엔드 (기존 구현)"""
+    name = "postgres"
+
+    def get_db_connection(self):
+        """데이터베이스 커넥션을 생성하고 반환합니다."""
+        # print(f"DEBUG: get_db_connection 함수 호출됨.") # 필요 시 주석 해제
+        if psycopg2 is None:
+            print("오류: psycopg2 가 설치되어 있지 않습니다! (pip install psycopg2-binary 또는 STORAGE_BACKEND='sqlite' 사용)")
+            return None
+        db_url = os.getenv('DATABASE_URL') # 함수 내부에서 읽기
+        if not db_url:
+             print("오류: DATABASE_URL 환경 변수를 찾을 수 없습니다! (.env 파일 또는 Replit Secrets 확인)")
+             return None
+        try:
+            # print(f"DEBUG: psycopg2.connect 시도: URL='{db_url}'")
+            conn = psycopg2.connect(db_url)
+            # print("DEBUG: psycopg2.connect 성공!")
+            return conn
+        except psycopg2.Error as e:
+            print(f"데이터베이스 연결 오류: {e}")
+            # print(f"DEBUG: 연결 실패 시 사용된 DATABASE_URL: '{db_url}'")
+            return None
+
+    def init_db(self):
+        """데이터베이스와 테이블 초기화 (없으면 생성, 있으면 likability 컬럼 추가 시도)"""
+        conn = self.get_db_connection()
+        if conn is None: return
+        try:
+            with conn:
+                with conn.cursor() as cursor:
                     # 기본값을 config 에서 가져옴
-                    cursor.execute('ALTER TABLE conversations ADD COLUMN IF NOT EXISTS likability INTEGER DEFAULT %s', (config.DEFAULT_LIKABILITY_SCORE,)) # <-- config 사용
-                    print("'likability' 컬럼 확인/추가 완료.")
-                except psycopg2.Error as alter_err:
-                     print(f"경고: 'likability' 컬럼 추가/확인 중 오류: {alter_err}")
-        print(f"데이터베이스 초기화 작업 완료.")
-    except psycopg2.Error as e: print(f"데이터베이스 초기화 중 오류 발생: {e}")
-    finally:
-        if conn: conn.close()
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS conversations (
+                            user_id BIGINT PRIMARY KEY,
+                            history TEXT,
+                            likability INTEGER DEFAULT %s
+                        )
+                    ''', (config.DEFAULT_LIKABILITY_SCORE,)) # <-- config 사용
+                    print("테이블 'conversations' 확인/생성 완료.")
+                    try:
+                        # 기본값을 config 에서 가져옴
+                        cursor.execute('ALTER TABLE conversations ADD COLUMN IF NOT EXISTS likability INTEGER DEFAULT %s', (config.DEFAULT_LIKABILITY_SCORE,)) # <-- config 사용
+                        print("'likability' 컬럼 확인/추가 완료.")
+                    except psycopg2.Error as alter_err:
+                         print(f"경고: 'likability' 컬럼 추가/확인 중 오류: {alter_err}")
+            print(f"데이터베이스 초기화 작업 완료.")
+        except psycopg2.Error as e: print(f"데이터베이스 초기화 중 오류 발생: {e}")
+        finally:
+            if conn: conn.close()
+
+    def load_user_data(self, user_id):
+        """DB에서 특정 사용자의 대화 기록과 호감도 로드"""
+        conn = self.get_db_connection()
+        # 기본값을 config 에서 가져옴
+        if conn is None: return [], config.DEFAULT_LIKABILITY_SCORE # <-- config 사용
+        # print(f"DEBUG: 데이터 로딩 시도 - 사용자 ID: {user_id}") # 필요 시 주석 해제
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT history, likability FROM conversations WHERE user_id = %s", (user_id,))
+                    result = cursor.fetchone()
+                    if result:
+                        # 기본값을 config 에서 가져옴
+                        likability = result[1] if result[1] is not None else config.DEFAULT_LIKABILITY_SCORE # <-- config 사용
+                        return _parse_history_json(user_id, result[0]), likability
+                    else: print(f"DEBUG: 로딩 - 사용자 ID {user_id}에 대한 기록 없음. 기본값 반환."); return [], config.DEFAULT_LIKABILITY_SCORE # <-- config 사용
+        except psycopg2.Error as e: print(f"사용자 {user_id} 데이터 로드 중 오류 발생: {e}"); return [], config.DEFAULT_LIKABILITY_SCORE # <-- config 사용
+        finally:
+            if conn: conn.close()
+
+    def save_user_data(self, user_id, history_list, likability_score):
+        """특정 사용자의 대화 기록과 호감도를 DB에 저장 (덮어쓰기)"""
+        conn = self.get_db_connection()
+        if conn is None: return
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    history_json = json.dumps(history_list, ensure_ascii=False)
+                    cursor.execute("""
+                        INSERT INTO conversations (user_id, history, likability)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            history = EXCLUDED.history,
+                            likability = EXCLUDED.likability;
+                    """, (user_id, history_json, likability_score))
+            # print(f"DEBUG: 저장 및 커밋 완료 - 사용자 ID: {user_id}")
+        except psycopg2.Error as e: print(f"사용자 {user_id} 데이터 저장 중 오류 발생: {e}")
+        except TypeError as e: print(f"사용자 {user_id} 기록 JSON 변환 중 오류 발생 (TypeError): {e}"); print(f"DEBUG: 저장 실패 데이터 (마지막 3개 턴): {history_list[-3:]}")
+        finally:
+            if conn: conn.close()
+
+    def get_all_user_ids(self):
+        """DB에 저장된 모든 사용자의 ID 목록을 반환합니다."""
+        conn = self.get_db_connection()
+        if conn is None: return []
+        user_ids = []
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT user_id FROM conversations")
+                    user_ids = [row[0] for row in cursor.fetchall()]
+        except psycopg2.Error as e:
+            print(f"모든 사용자 ID 로드 중 오류 발생: {e}")
+        finally:
+            if conn: conn.close()
+        return user_ids
+
+    def delete_user_data(self, user_id):
+        """특정 사용자의 저장 데이터 삭제"""
+        conn = self.get_db_connection()
+        if conn is None: return
+        try:
+            with conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM conversations WHERE user_id = %s", (user_id,))
+        except psycopg2.Error as e: print(f"사용자 {user_id} 데이터 삭제 중 오류 발생: {e}")
+        finally:
+            if conn: conn.close()
+
+class SQLiteStorage(StorageBackend):
+    """단일 서버 배포용 내장 SQLite 백엔드 (WAL 모드)
+
+    커넥션 하나를 열어두고 재사용하므로 호출마다 네트워크 왕복/접속 비용이 없음.
+    백그라운드 스레드에서 호출될 수도 있으므로 커넥션 접근은 락으로 직렬화.
+    """
+    name = "sqlite"
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or config.SQLITE_DB_PATH
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self):
+        """열려 있는 공유 커넥션 반환 (없으면 새로 열고 WAL 모드 설정). 반드시 self._lock 안에서만 호출"""
+        if self._conn is not None:
+            return self._conn
+        try:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # WAL 모드에서는 NORMAL 로도 DB 손상 없음
+            self._conn = conn
+            return conn
+        except sqlite3.Error as e:
+            print(f"데이터베이스 연결 오류 (SQLite: {self.db_path}): {e}")
+            return None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def init_db(self):
+        """테이블 초기화 (없으면 생성)"""
+        with self._lock:
+            conn = self._get_connection()
+            if conn is None: return
+            try:
+                with conn:
+                    conn.execute(f'''
+                        CREATE TABLE IF NOT EXISTS conversations (
+                            user_id INTEGER PRIMARY KEY,
+                            history TEXT,
+                            likability INTEGER DEFAULT {int(config.DEFAULT_LIKABILITY_SCORE)}
+                        )
+                    ''')
+                print(f"테이블 'conversations' 확인/생성 완료 (SQLite: {self.db_path}).")
+            except sqlite3.Error as e: print(f"데이터베이스 초기화 중 오류 발생: {e}")
+
+    def load_user_data(self, user_id):
+        """DB에서 특정 사용자의 대화 기록과 호감도 로드"""
+        with self._lock:
+            conn = self._get_connection()
+            if conn is None: return [], config.DEFAULT_LIKABILITY_SCORE
+            try:
+                result = conn.execute("SELECT history, likability FROM conversations WHERE user_id = ?", (user_id,)).fetchone()
+            except sqlite3.Error as e: print(f"사용자 {user_id} 데이터 로드 중 오류 발생: {e}"); return [], config.DEFAULT_LIKABILITY_SCORE
+        if result:
+            likability = result[1] if result[1] is not None else config.DEFAULT_LIKABILITY_SCORE
+            return _parse_history_json(user_id, result[0]), likability
+        print(f"DEBUG: 로딩 - 사용자 ID {user_id}에 대한 기록 없음. 기본값 반환.")
+        return [], config.DEFAULT_LIKABILITY_SCORE
+
+    def save_user_data(self, user_id, history_list, likability_score):
+        """특정 사용자의 대화 기록과 호감도를 DB에 저장 (덮어쓰기)"""
+        try:
+            history_json = json.dumps(history_list, ensure_ascii=False)
+        except TypeError as e: print(f"사용자 {user_id} 기록 JSON 변환 중 오류 발생 (TypeError): {e}"); print(f"DEBUG: 저장 실패 데이터 (마지막 3개 턴): {history_list[-3:]}"); return
+        with self._lock:
+            conn = self._get_connection()
+            if conn is None: return
+            try:
+                with conn:
+                    conn.execute("""
+                        INSERT INTO conversations (user_id, history, likability)
+                        VALUES (?, ?, ?)
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            history = excluded.history,
+                            likability = excluded.likability
+                    """, (user_id, history_json, likability_score))
+            except sqlite3.Error as e: print(f"사용자 {user_id} 데이터 저장 중 오류 발생: {e}")
+
+    def get_all_user_ids(self):
+        """DB에 저장된 모든 사용자의 ID 목록을 반환합니다."""
+        with self._lock:
+            conn = self._get_connection()
+            if conn is None: return []
+            try:
+                return [row[0] for row in conn.execute("SELECT user_id FROM conversations").fetchall()]
+            except sqlite3.Error as e:
+                print(f"모든 사용자 ID 로드 중 오류 발생: {e}")
+                return []
+
+    def delete_user_data(self, user_id):
+        """특정 사용자의 저장 데이터 삭제"""
+        with self._lock:
+            conn = self._get_connection()
+            if conn is None: return
+            try:
+                with conn:
+                    conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+            except sqlite3.Error as e: print(f"사용자 {user_id} 데이터 삭제 중 오류 발생: {e}")
+
+STORAGE_BACKENDS = {
+    PostgresStorage.name: PostgresStorage,
+    SQLiteStorage.name: SQLiteStorage,
+}
+
+_storage = None
+
+def get_storage():
+    """설정(STORAGE_BACKEND 환경 변수 > config.STORAGE_BACKEND)에 맞는 백엔드 인스턴스 반환"""
+    global _storage
+    if _storage is None:
+        backend_name = (os.getenv('STORAGE_BACKEND') or config.STORAGE_BACKEND).lower()
+        if backend_name not in STORAGE_BACKENDS:
+            print(f"경고: 알 수 없는 STORAGE_BACKEND '{backend_name}'. 'postgres' 사용.")
+            backend_name = PostgresStorage.name
+        _storage = STORAGE_BACKENDS[backend_name]()
+        print(f"저장소 백엔드 선택됨: {backend_name}")
+    return _storage
+
+def set_storage(backend):
+    """사용할 백엔드 인스턴스를 직접 지정 (벤치마크/점검용)"""
+    global _storage
+    _storage = backend
+
+# --- 기존 함수 인터페이스 (다른 모듈은 이 함수들만 사용) ---
+def init_db():
+    """데이터베이스와 테이블 초기화"""
+    get_storage().init_db()
 
 def load_user_data(user_id):
     """DB에서 특정 사용자의 대화 기록과 호감도 로드"""
-    conn = get_db_connection()
-    # 기본값을 config 에서 가져옴
-    if conn is None: return [], config.DEFAULT_LIKABILITY_SCORE # <-- config 사용
-    # print(f"DEBUG: 데이터 로딩 시도 - 사용자 ID: {user_id}") # 필요 시 주석 해제
-    try:
-        with conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT history, likability FROM conversations WHERE user_id = %s", (user_id,))
-                result = cursor.fetchone()
-                if result:
-                    history_json = result[0] if result[0] else '[]'
-                    # 기본값을 config 에서 가져옴
-                    likability = result[1] if result[1] is not None else config.DEFAULT_LIKABILITY_SCORE # <-- config 사용
-                    # print(f"DEBUG: 로딩 성공 - DB 내용 (JSON 시작 부분): {history_json[:100]}...")
-                    try: history_list = json.loads(history_json)
-                    except json.JSONDecodeError: print(f"경고: 사용자 {user_id}의 history JSON 파싱 오류. 빈 리스트 반환."); history_list = []
-                    # print(f"DEBUG: 로딩 성공 - 변환된 리스트 (총 {len(history_list)} 턴), 호감도: {likability}")
-                    return history_list, likability
-                else: print(f"DEBUG: 로딩 - 사용자 ID {user_id}에 대한 기록 없음. 기본값 반환."); return [], config.DEFAULT_LIKABILITY_SCORE # <-- config 사용
-    except psycopg2.Error as e: print(f"사용자 {user_id} 데이터 로드 중 오류 발생: {e}"); return [], config.DEFAULT_LIKABILITY_SCORE # <-- config 사용
-    finally:
-        if conn: conn.close()
+    return get_storage().load_user_data(user_id)
 
 def save_user_data(user_id, history_list, likability_score):
     """특정 사용자의 대화 기록과 호감도를 DB에 저장 (덮어쓰기)"""
-    conn = get_db_connection()
-    if conn is None: return
-    # print(f"DEBUG: 저장 시도 - 사용자 ID: {user_id}, 저장할 기록 턴 수: {len(history_list)}, 호감도: {likability_score}") # 필요 시 주석 해제
-    try:
-        with conn:
-            with conn.cursor() as cursor:
-                history_json = json.dumps(history_list, ensure_ascii=False)
-                # print(f"DEBUG: 저장할 JSON (시작 부분): {history_json[:100]}...")
-                cursor.execute("""
-                    INSERT INTO conversations (user_id, history, likability)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (user_id) DO UPDATE SET
-                        history = EXCLUDED.history,
-                        likability = EXCLUDED.likability;
-                """, (user_id, history_json, likability_score))
-                # print(f"DEBUG: 저장 쿼리 실행 완료 - 사용자 ID: {user_id}, 호감도: {likability_score}")
-        # print(f"DEBUG: 저장 및 커밋 완료 - 사용자 ID: {user_id}")
-    except psycopg2.Error as e: print(f"사용자 {user_id} 데이터 저장 중 오류 발생: {e}")
-    except TypeError as e: print(f"사용자 {user_id} 기록 JSON 변환 중 오류 발생 (TypeError): {e}"); print(f"DEBUG: 저장 실패 데이터 (마지막 3개 턴): {history_list[-3:]}")
-    finally:
-        if conn: conn.close()
+    get_storage().save_user_data(user_id, history_list, likability_score)
 
 def get_all_user_ids():
     """DB에 저장된 모든 사용자의 ID 목록을 반환합니다."""
-    conn = get_db_connection()
-    if conn is None: return []
-    user_ids = []
-    try:
-        with conn:
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT user_id FROM conversations")
-                results = cursor.fetchall()
-                user_ids = [row[0] for row in results]
-                # print(f"DEBUG: get_all_user_ids - {len(user_ids)} 명의 사용자 ID 로드됨.") # 필요 시 주석 해제
-    except psycopg2.Error as e:
-        print(f"모든 사용자 ID 로드 중 오류 발생: {e}")
-    finally:
-        if conn: conn.close()
-    return user_ids
\ No newline at end of file
+    return get_storage().get_all_user_ids()
+
+# --- 배치당 저장 지연시간 측정 (인터페이스 규약 테스트는 tests/test_database.py) ---
+def benchmark_backend(backend, batches=200, user_id=-1):
+    """배치 1회 처리에 해당하는 load + save 의 평균/최대 지연시간(ms) 측정"""
+    backend.init_db()
+    history = [{'role': 'user' if i % 2 == 0 else 'model', 'parts': [f"메시지 {i} " * 10]} for i in range(20)]
+    backend.save_user_data(user_id, history, config.DEFAULT_LIKABILITY_SCORE)
+    timings = []
+    for _ in range(batches):
+        start = time.perf_counter()
+        loaded_history, likability = backend.load_user_data(user_id)
+        backend.save_user_data(user_id, loaded_history, likability)
+        timings.append((time.perf_counter() - start) * 1000)
+    backend.delete_user_data(user_id)
+    timings.sort()
+    result = {
+        "backend": backend.name,
+        "batches": batches,
+        "avg_ms": sum(timings) / len(timings),
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        "max_ms": timings[-1],
+    }
+    print(f"[저장소 벤치마크] {result['backend']}: 평균 {result['avg_ms']:.2f}ms, p95 {result['p95_ms']:.2f}ms, 최대 {result['max_ms']:.2f}ms ({batches}회)")
+    return result
+
+if __name__ == "__main__":
+    # 사용법: python database.py  (DATABASE_URL 이 있으면 PostgreSQL 도 함께 측정)
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backends = [SQLiteStorage(os.path.join(tmp_dir, "bench.sqlite3"))]
+        if psycopg2 is not None and os.getenv('DATABASE_URL'):
+            backends.append(PostgresStorage())
+        for backend in backends:
+            benchmark_backend(backend)
+        backends[0].close()
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+# memory_store.py - trim_history 로 잘려나간 예전 대화를 기억해두는 사용자별 장기 기억 저장소
+# 외부 임베딩 서비스 없이 해시된 문자 n-gram 특징 벡터 + NumPy 코사인 유사도로 검색
+
+import asyncio
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+import config
+
+ROLE_LABELS = {'user': "사용자", 'model': "하늘이"}
+VECTOR_DTYPE = np.float16  # 보관용 벡터 자료형 (float32 의 절반 메모리/디스크)
+
+def _normalize_text(text):
+    return " ".join(str(text).lower().split())
+
+def embed_text(text, dim=None):
+    """문자 n-gram 을 해시해서 dim 차원 벡터로 만들고 L2 정규화 (빈 텍스트는 0 벡터)"""
+    dim = dim or config.MEMORY_FEATURE_DIM
+    vector = np.zeros(dim, dtype=np.float32)
+    text = _normalize_text(text)
+    for n in config.MEMORY_NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram.isspace():
+                continue
+            # 파이썬 hash() 는 실행마다 달라지므로 crc32 사용 (저장된 인덱스를 재시작 후에도 쓰기 위해)
+            h = zlib.crc32(gram.encode('utf-8'))
+            vector[h % dim] += 1.0 if (h >> 31) & 1 == 0 else -1.0
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+def format_turn(turn):
+    """history 의 한 턴({'role', 'parts'})을 검색/프롬프트용 한 줄 텍스트로 변환"""
+    role = ROLE_LABELS.get(turn.get('role'), turn.get('role'))
+    content = " ".join(str(part) for part in turn.get('parts', []))
+    return f"{role}: {content.strip()}"
+
+class UserMemoryIndex:
+    """한 사용자의 기억 스니펫과 특징 벡터 (최대 capacity 개를 보관하는 링 버퍼)
+
+    가득 차면 가장 오래된 행을 제자리에서 덮어쓰므로 추가할 때마다 배열 전체를 복사하지 않음.
+    벡터는 메모리 절약을 위해 float16 으로 보관 (검색 시 float32 로 계산).
+    """
+
+    def __init__(self, dim=None, capacity=None):
+        self.dim = dim or config.MEMORY_FEATURE_DIM
+        self.capacity = capacity or config.MEMORY_MAX_SNIPPETS_PER_USER
+        self._texts: List[str] = []
+        self._vectors = np.zeros((0, self.dim), dtype=VECTOR_DTYPE)
+        self._next = 0  # 가득 찬 뒤 다음에 덮어쓸 위치
+        self.persisted_lines = 0  # 기억 파일에 저장된 줄 수 (압축 시점 판단용, LongTermMemory 가 관리)
+
+    def __len__(self):
+        return len(self._texts)
+
+    @property
+    def texts(self):
+        """오래된 것부터 순서대로 정렬된 스니펫 목록"""
+        if len(self._texts) < self.capacity:
+            return list(self._texts)
+        return self._texts[self._next:] + self._texts[:self._next]
+
+    @property
+    def vectors(self):
+        """texts 와 같은 순서의 벡터 행렬"""
+        count = len(self._texts)
+        if count < self.capacity:
+            return self._vectors[:count]
+        return np.concatenate([self._vectors[self._next:], self._vectors[:self._next]])
+
+    def add(self, texts, vectors=None):
+        """새 스니펫 추가 후 추가된 (텍스트, 벡터) 반환. vectors 가 주어지면 임베딩을 다시 계산하지 않음
+
+        배열은 용량까지만 두 배씩 늘리고, 가득 차면 오래된 행을 덮어씀.
+        """
+        if vectors is None:
+            texts = [t for t in texts if t and t.strip()]
+            vectors = np.zeros((len(texts), self.dim), dtype=VECTOR_DTYPE)
+            for i, text in enumerate(texts):
+                vectors[i] = embed_text(text, self.dim)
+        texts, vectors = list(texts)[-self.capacity:], vectors[-self.capacity:]
+        for text, vector in zip(texts, vectors):
+            if len(self._texts) < self.capacity:
+                row = len(self._texts)
+                if row >= self._vectors.shape[0]:
+                    grown = np.zeros((min(self.capacity, max(16, self._vectors.shape[0] * 2)), self.dim), dtype=VECTOR_DTYPE)
+                    grown[:row] = self._vectors[:row]
+                    self._vectors = grown
+                self._texts.append(text)
+            else:
+                row = self._next
+                self._texts[row] = text
+                self._next = (self._next + 1) % self.capacity
+            self._vectors[row] = vector
+        return texts, vectors
+
+    def search(self, query, top_k=None, min_score=None):
+        """쿼리와 코사인 유사도가 높은 스니펫 [(텍스트, 점수)] 를 점수 높은 순으로 반환"""
+        top_k = config.MEMORY_TOP_K if top_k is None else top_k
+        min_score = config.MEMORY_MIN_SCORE if min_score is None else min_score
+        if not self._texts or top_k <= 0:
+            return []
+        scores = self._vectors[:len(self._texts)] @ embed_text(query, self.dim)
+        k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self._texts[i], float(scores[i])) for i in candidates if scores[i] >= min_score]
+
+class LongTermMemory:
+    """사용자별 UserMemoryIndex 관리
+
+    - (설정 시) MEMORY_STORE_DIR 에 사용자별 스니펫 텍스트(.jsonl)와 float16 벡터(.f16, 원시 바이트)를
+      같은 순서로 한 줄/한 행씩 이어 붙여 저장. 돌아온 사용자는 벡터 파일을 그대로 읽으므로 다시 임베딩하지 않음
+      (벡터 파일이 없거나 줄 수가 안 맞으면 텍스트로 다시 계산). 파일이 용량의 두 배를 넘으면 최근 것만 남기고 압축.
+    - 디스크 I/O 와 벡터 계산은 이벤트 루프를 막지 않도록 스레드에서 실행.
+      사용자별(해시로 나눈) 락으로 직렬화하고, 전체 락은 캐시 딕셔너리를 바꿀 때만 잠깐 잡음
+      (한 사용자의 파일 로드가 다른 사용자의 검색을 막지 않도록).
+    - 메모리에 올려두는 사용자는 MEMORY_MAX_CACHED_USERS 명까지 (넘으면 가장 오래 안 쓴 사용자부터 내림).
+      파일로 보관 중이면 MEMORY_IDLE_EVICT_SECONDS 동안 안 쓴 사용자도 내림.
+    """
+
+    USER_LOCK_STRIPES = 64
+
+    def __init__(self, store_dir=None):
+        self.store_dir = config.MEMORY_STORE_DIR if store_dir is None else store_dir
+        self._indexes: "OrderedDict[int, UserMemoryIndex]" = OrderedDict()  # 최근 사용 순
+        self._last_used: Dict[int, float] = {}
+        self._lock = threading.Lock()  # _indexes/_last_used 보호용 (짧게만 잡음)
+        self._user_locks = [threading.Lock() for _ in range(self.USER_LOCK_STRIPES)]
+
+    def _user_lock(self, user_id):
+        return self._user_locks[hash(user_id) % self.USER_LOCK_STRIPES]
+
+    def _path(self, user_id):
+        return os.path.join(self.store_dir, f"{user_id}.jsonl")
+
+    def _vector_path(self, user_id):
+        # 차원/n-gram 설정이 바뀌면 다른 파일을 쓰도록 이름에 포함 (예전 벡터를 잘못 읽지 않게)
+        ngrams = "".join(str(n) for n in config.MEMORY_NGRAM_SIZES)
+        return os.path.join(self.store_dir, f"{user_id}.{config.MEMORY_FEATURE_DIM}d{ngrams}.f16")
+
+    def _load_index(self, user_id):
+        """(사용자 락 안에서 호출) 파일에서 인덱스 로드. 벡터 파일이 맞으면 그대로, 아니면 다시 임베딩"""
+        index = UserMemoryIndex()
+        if not (self.store_dir and os.path.exists(self._path(user_id))):
+            return index
+        try:
+            with open(self._path(user_id), encoding='utf-8') as f:
+                texts = [json.loads(line) for line in f if line.strip()]
+            vectors = None
+            if os.path.exists(self._vector_path(user_id)):
+                raw = np.fromfile(self._vector_path(user_id), dtype=VECTOR_DTYPE)
+                if raw.size == len(texts) * index.dim:
+                    vectors = raw.reshape(len(texts), index.dim)
+            index.add(texts, vectors)
+            index.persisted_lines = len(texts)
+            if vectors is None:
+                print(f"DEBUG: 사용자 {user_id} 장기 기억 벡터 파일 없음/불일치 - 다시 계산해서 저장")
+                self._rewrite_files(user_id, index)
+        except Exception as e:
+            print(f"경고: 사용자 {user_id} 장기 기억 파일 로드 중 오류 - {e}. 빈 기억으로 시작.")
+            index = UserMemoryIndex()
+        return index
+
+    def _get_index(self, user_id):
+        """(사용자 락 안에서 호출) 인덱스 반환, 없으면 전체 락 밖에서 파일 로드 후 캐시에 넣음"""
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is None:
+            index = self._load_index(user_id)
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            self._last_used[user_id] = time.monotonic()
+            self._evict_idle()
+        return index
+
+    def _evict_idle(self):
+        """(전체 락 안에서 호출) 캐시 상한을 넘거나 오래 안 쓴 사용자의 인덱스를 메모리에서 내림"""
+        now = time.monotonic()
+        while len(self._indexes) > 1:
+            oldest_user_id = next(iter(self._indexes))
+            over_capacity = len(self._indexes) > config.MEMORY_MAX_CACHED_USERS
+            # 파일 보관이 없으면 내리는 순간 기억이 사라지므로 상한을 넘을 때만 내림
+            idle = bool(self.store_dir) and now - self._last_used.get(oldest_user_id, now) >= config.MEMORY_IDLE_EVICT_SECONDS
+            if not (over_capacity or idle):
+                break
+            if not self.store_dir:
+                print(f"경고: 장기 기억 캐시 상한({config.MEMORY_MAX_CACHED_USERS}명) 초과 - 사용자 {oldest_user_id} 기억 삭제 (MEMORY_STORE_DIR 미설정)")
+            del self._indexes[oldest_user_id]
+            self._last_used.pop(oldest_user_id, None)
+
+    def _rewrite_files(self, user_id, index):
+        """현재 인덱스 내용만으로 텍스트/벡터 파일을 다시 씀 (압축 및 벡터 파일 복구)"""
+        text_path, vector_path = self._path(user_id), self._vector_path(user_id)
+        with open(text_path + ".tmp", 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(t, ensure_ascii=False) + "\n" for t in index.texts)
+        with open(vector_path + ".tmp", 'wb') as f:
+            f.write(index.vectors.tobytes())
+        os.replace(text_path + ".tmp", text_path)
+        os.replace(vector_path + ".tmp", vector_path)
+        index.persisted_lines = len(index)
+
+    def _append_to_file(self, user_id, index, texts, vectors):
+        if not self.store_dir:
+            return
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            if index.persisted_lines + len(texts) > index.capacity * 2:
+                # 보관 용량보다 훨씬 길어졌으면 현재 인덱스 내용만 남기고 다시 씀
+                self._rewrite_files(user_id, index)
+                return
+            with open(self._path(user_id), 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(t, ensure_ascii=False) + "\n" for t in texts)
+            with open(self._vector_path(user_id), 'ab') as f:
+                f.write(np.ascontiguousarray(vectors, dtype=VECTOR_DTYPE).tobytes())
+            index.persisted_lines += len(texts)
+        except Exception as e:
+            print(f"오류: 사용자 {user_id} 장기 기억 저장 중 오류 - {e}")
+
+    def _add_turns_sync(self, user_id, texts):
+        with self._user_lock(user_id):
+            index = self._get_index(user_id)
+            added_texts, added_vectors = index.add(texts)
+            self._append_to_file(user_id, index, added_texts, added_vectors)
+            return len(index)
+
+    def _retrieve_sync(self, user_id, query, top_k):
+        with self._user_lock(user_id):
+            return self._get_index(user_id).search(query, top_k)
+
+    async def add_turns(self, user_id, turns):
+        """trim_history 로 잘려나가는 턴들을 기억에 추가"""
+        texts = [format_turn(turn) for turn in turns]
+        if not texts:
+            return
+        total = await asyncio.to_thread(self._add_turns_sync, user_id, texts)
+        print(f"DEBUG: 장기 기억 추가 - 사용자 ID: {user_id}, 추가 {len(texts)}턴, 총 {total}개")
+
+    async def retrieve(self, user_id, query, top_k=None):
+        """현재 메시지와 관련된 예전 대화 스니펫 텍스트 리스트 반환"""
+        start = time.perf_counter()
+        results = await asyncio.to_thread(self._retrieve_sync, user_id, query, top_k)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"DEBUG: 장기 기억 검색 - 사용자 ID: {user_id}, {len(results)}개 찾음 ({elapsed_ms:.2f}ms)")
+        return [text for text, _ in results]
+
+long_term_memory = LongTermMemory()
+
+def benchmark_retrieval(snippet_counts=(100, 1000, 5000), queries=200):
+    """스니펫 개수별 증분 추가 및 검색 지연시간(ms) 측정 (보관 용량을 넘는 개수는 링 버퍼 덮어쓰기 포함)"""
+    rng = np.random.default_rng(0)
+    words = ["오늘", "학교", "강아지", "시험", "친구", "여행", "제주도", "떡볶이", "영화", "생일", "알바", "고양이", "축구", "노래"]
+    results = []
+    for count in snippet_counts:
+        index = UserMemoryIndex()
+        snippets = [f"사용자: " + " ".join(rng.choice(words, 6)) for _ in range(count)]
+        start = time.perf_counter()
+        for i in range(0, count, 2):  # 실제처럼 user/model 2턴씩 증분 추가
+            index.add(snippets[i:i + 2])
+        add_ms = (time.perf_counter() - start) * 1000 / max(1, count // 2)
+        timings = []
+        for _ in range(queries):
+            query = " ".join(rng.choice(words, 4))
+            start = time.perf_counter()
+            index.search(query, min_score=-1.0)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        result = {
+            "snippets": len(index),
+            "add_ms": add_ms,
+            "avg_ms": sum(timings) / len(timings),
+            "p95_ms": timings[int(len(timings) * 0.95) - 1],
+        }
+        print(f"[장기 기억 벤치마크] 스니펫 {result['snippets']}개: 추가 {result['add_ms']:.3f}ms/배치, 검색 평균 {result['avg_ms']:.3f}ms, p95 {result['p95_ms']:.3f}ms")
+        results.append(result)
+    return results
+
+if __name__ == "__main__":
+    # 사용법: python memory_store.py
+    benchmark_retrieval()
@@ -4,23 +4,204 @@
 import asyncio
 import random
 import re
+import time
 import traceback
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import discord
 
 from database import load_user_data, save_user_data
 import config
 from ai_service import generate_response, calculate_likability, summarize_text
+from memory_store import long_term_memory
 
 # 메시지 버퍼 및 타이머 관리용 전역 변수
 user_message_buffers: Dict[int, List[discord.Message]] = {}
 user_timer_tasks: Dict[int, asyncio.Task] = {}
+# 추측 답변 생성 작업 (기준 메시지 ID 묶음, 작업) 및 통계 (config.SPECULATIVE_REPLY_ENABLED)
+user_speculative_tasks: Dict[int, Tuple[tuple, asyncio.Task]] = {}
+speculative_stats = {'started': 0, 'committed': 0, 'discarded': 0, 'latency_saved_seconds': 0.0}
+# 사용자별 후처리(호감도 계산 + 기록 저장) 완료 future. 버퍼를 꺼낼 때 등록해서 다음 묶음이 이 저장이 끝난 뒤에 로드하도록 함
+user_post_process_futures: Dict[int, asyncio.Future] = {}
+_post_process_jobs = set()  # 실행 중인 백그라운드 후처리 작업 (GC 방지용 참조)
+# 답변 지연시간 통계 (처리 방식별: 첫 문장 전송까지 / 전체 전송 완료까지)
+reply_latency_stats: Dict[str, Dict[str, float]] = {}
 
-async def process_message_batch(user_id: int, model, bot_user):
+async def run_post_processing(user_id: int, router, combined_message_content, current_history, current_likability, bot_response_text_full):
+    """답변 전송과 무관한 후처리: 호감도 계산, 대화 기록 추가/정리, DB 저장"""
+    new_likability = await calculate_likability(router, current_likability, combined_message_content)
+    
+    # 대화 기록에 추가
+    current_history.append({'role': 'user', 'parts': [combined_message_content]})
+    current_history.append({'role': 'model', 'parts': [bot_response_text_full]})  # 전체 응답 저장
+    
+    # 대화 기록 관리 (최대 길이 제한, 잘려나가는 턴은 장기 기억으로)
+    trimmed_history = trim_history(current_history)
+    evicted_turns = current_history[:len(current_history) - len(trimmed_history)]
+    current_history = trimmed_history
+    if evicted_turns and config.LONG_TERM_MEMORY_ENABLED:
+        await long_term_memory.add_turns(user_id, evicted_turns)
+    
+    # DB에 저장 (동기 DB 호출이 이벤트 루프를 막지 않도록 스레드에서 실행)
+    await asyncio.to_thread(save_user_data, user_id, current_history, new_likability)
+    print(f"DEBUG: 대화 저장 완료 (총 {len(current_history)} 턴), 새 호감도: {new_likability}")
+
+def reserve_post_processing(user_id: int):
+    """(버퍼를 꺼낸 직후 await 없이 호출) 이 묶음의 후처리 완료 future 를 등록하고 (직전 future, 새 future) 반환
+
+    답변을 생성하는 동안 다음 묶음이 시작돼도 wait_for_post_processing 이 이 묶음의 저장까지 기다리게 됨.
+    """
+    previous = user_post_process_futures.get(user_id)
+    pending = asyncio.get_running_loop().create_future()
+    user_post_process_futures[user_id] = pending
+    return previous, pending
+
+def finish_post_processing(user_id: int, pending: asyncio.Future):
+    """후처리 완료 (또는 후처리 없이 묶음 처리 종료) 표시 -> 기다리던 다음 작업 진행"""
+    if not pending.done():
+        pending.set_result(None)
+    if user_post_process_futures.get(user_id) is pending:
+        del user_post_process_futures[user_id]
+
+def schedule_post_processing(user_id: int, pending: asyncio.Future, *args):
+    """후처리를 백그라운드로 실행하고 끝나면 pending 완료 (순서는 다음 묶음이 로드 전에 pending 을 기다려서 보장)"""
+    async def run():
+        try:
+            await run_post_processing(user_id, *args)
+        except Exception as e:
+            print(f"오류: 백그라운드 후처리 중 예외 발생 - 사용자 ID: {user_id}, 오류: {e}")
+            traceback.print_exc()
+        finally:
+            finish_post_processing(user_id, pending)
+
+    task = asyncio.create_task(run())
+    _post_process_jobs.add(task)
+    task.add_done_callback(_post_process_jobs.discard)
+    return task
+
+async def _wait_for_pending(user_id: int, pending: Optional[asyncio.Future]):
+    if pending is not None and not pending.done():
+        print(f"DEBUG: 이전 묶음 후처리 대기 - 사용자 ID: {user_id}")
+        # 기다리는 쪽이 취소돼도 후처리 자체는 끝까지 실행되도록 shield
+        await asyncio.shield(pending)
+
+async def wait_for_post_processing(user_id: int):
+    """해당 사용자의 진행 중인 묶음 처리/후처리가 끝날 때까지 대기 (갱신된 호감도/기록을 보도록)"""
+    await _wait_for_pending(user_id, user_post_process_futures.get(user_id))
+
+def record_reply_latency(mode: str, first_send_seconds: float, total_seconds: float):
+    """처리 방식별 답변 지연시간 누적 및 출력"""
+    stats = reply_latency_stats.setdefault(mode, {'count': 0, 'first_send': 0.0, 'total': 0.0})
+    stats['count'] += 1
+    stats['first_send'] += first_send_seconds
+    stats['total'] += total_seconds
+    print(f"DEBUG: 답변 지연시간 ({mode}) - 첫 문장까지 {first_send_seconds:.2f}초, 전체 {total_seconds:.2f}초 "
+          f"(평균: 첫 문장 {stats['first_send'] / stats['count']:.2f}초, {stats['count']}회)")
+
+async def speculative_generate(user_id: int, messages: List[discord.Message], router, previous_post_process=None):
+    """대기 시간 동안 현재 버퍼 기준으로 미리 답변 생성 (입력 스냅샷과 결과를 함께 반환)"""
+    combined_message_content = "\n".join([msg.content for msg in messages])
+    await _wait_for_pending(user_id, previous_post_process)
+    current_history, current_likability = load_user_data(user_id)
+    memory_snippets = await long_term_memory.retrieve(user_id, combined_message_content) if config.LONG_TERM_MEMORY_ENABLED else None
+    started = time.perf_counter()
+    bot_response_text_full, final_text_to_send = await generate_response(
+        router, combined_message_content, current_history, current_likability, memory_snippets)
+    return {
+        'history': current_history,
+        'likability': current_likability,
+        'response': (bot_response_text_full, final_text_to_send),
+        'started': started,
+        'finished': time.perf_counter(),
+    }
+
+def start_speculative_reply(user_id: int, router):
+    """이전 추측 작업을 취소/폐기하고 현재 버퍼 기준으로 새로 시작"""
+    discard_speculative_reply(user_id, "새 메시지 수신")
+    messages = list(user_message_buffers.get(user_id, []))
+    if not messages:
+        return
+    message_ids = tuple(msg.id for msg in messages)
+    user_speculative_tasks[user_id] = (message_ids, asyncio.create_task(
+        speculative_generate(user_id, messages, router, user_post_process_futures.get(user_id))))
+    speculative_stats['started'] += 1
+    print(f"DEBUG: 추측 답변 생성 시작 - 사용자 ID: {user_id}, 메시지 {len(messages)}개 기준")
+
+def discard_speculative_reply(user_id: int, reason: str):
+    """진행 중이거나 완료된 추측 작업 폐기 (통계에 낭비로 기록)"""
+    entry = user_speculative_tasks.pop(user_id, None)
+    if entry is None:
+        return
+    _, task = entry
+    if not task.done():
+        task.cancel()
+    speculative_stats['discarded'] += 1
+    print(f"DEBUG: 추측 답변 폐기 ({reason}) - 사용자 ID: {user_id}")
+    log_speculative_stats()
+
+def claim_speculative_reply(user_id: int, messages: List[discord.Message]) -> Optional[asyncio.Task]:
+    """버퍼를 꺼낸 직후 (await 없이) 호출: 같은 메시지 묶음 기준 추측 작업이면 가져오고, 아니면 폐기
+
+    꺼낸 뒤 새 메시지가 와서 start_speculative_reply 가 다른 묶음 기준 작업으로 바꿔치기하기 전에 확보하기 위함.
+    """
+    entry = user_speculative_tasks.get(user_id)
+    if entry is None:
+        return None
+    if entry[0] != tuple(msg.id for msg in messages):
+        discard_speculative_reply(user_id, "메시지 묶음 불일치")
+        return None
+    del user_speculative_tasks[user_id]
+    return entry[1]
+
+async def take_speculative_reply(user_id: int, task: Optional[asyncio.Task], current_history, current_likability):
+    """claim_speculative_reply 로 가져온 추측 결과가 같은 기록/호감도로 만들어졌으면 (전체 응답, 최종 텍스트) 반환, 아니면 None"""
+    if task is None:
+        return None
+    check_time = time.perf_counter()
+    try:
+        speculation = await task
+    except asyncio.CancelledError:
+        current_task = asyncio.current_task()
+        if current_task is not None and current_task.cancelling():
+            raise  # 추측 작업이 아니라 이 묶음 처리 자체가 취소된 경우
+        speculation = None
+    except Exception as e:
+        print(f"오류: 추측 답변 생성 중 예외 발생 - 사용자 ID: {user_id}, 오류: {e}")
+        speculation = None
+
+    if (speculation is None
+            or speculation['history'] != current_history
+            or speculation['likability'] != current_likability):
+        # 입력이 달라졌으면 (예: 이전 묶음 저장이 추측 시작 후에 끝남) 사용하지 않음
+        speculative_stats['discarded'] += 1
+        print(f"DEBUG: 추측 답변 폐기 (입력 불일치) - 사용자 ID: {user_id}")
+        log_speculative_stats()
+        return None
+
+    # 대기 시간이 끝나는 시점까지 이미 진행된 생성 시간만큼 응답이 빨라짐
+    saved = min(speculation['finished'], check_time) - speculation['started']
+    speculative_stats['committed'] += 1
+    speculative_stats['latency_saved_seconds'] += max(0.0, saved)
+    print(f"DEBUG: 추측 답변 사용 - 사용자 ID: {user_id}, 단축된 지연시간: {saved:.2f}초")
+    log_speculative_stats()
+    return speculation['response']
+
+def log_speculative_stats():
+    """추측 답변 낭비율과 누적 단축 시간 출력"""
+    started = speculative_stats['started']
+    if not started:
+        return
+    waste_rate = speculative_stats['discarded'] / started * 100
+    committed = speculative_stats['committed']
+    avg_saved = speculative_stats['latency_saved_seconds'] / committed if committed else 0.0
+    print(f"DEBUG: 추측 답변 통계 - 시작 {started}, 사용 {committed}, 폐기 {speculative_stats['discarded']} "
+          f"(낭비율 {waste_rate:.1f}%), 평균 단축 {avg_saved:.2f}초")
+
+async def process_message_batch(user_id: int, router, bot_user):
     """타이머 만료 시 메시지 묶음 처리 함수"""
     global user_message_buffers, user_timer_tasks
     print(f"DEBUG: process_message_batch 시작 - 사용자 ID: {user_id}")
+    batch_started = time.perf_counter()
     
     if user_id in user_timer_tasks:
         del user_timer_tasks[user_id]
@@ -31,6 +212,8 @@ async def process_message_batch(user_id: int, model, bot_user):
         return
         
     messages_to_process = user_message_buffers.pop(user_id)
+    # 버퍼를 꺼낸 것과 같은 동기 구간에서 추측 작업도 확보 (await 사이에 새 메시지로 바뀌지 않도록)
+    speculative_task = claim_speculative_reply(user_id, messages_to_process)
     print(f"DEBUG: process_message_batch - 버퍼 메시지 가져옴 (개수: {len(messages_to_process)})")
     
     if not messages_to_process:
@@ -42,50 +225,69 @@ async def process_message_batch(user_id: int, model, bot_user):
     combined_message_content = "\n".join([msg.content for msg in messages_to_process])
     print(f"DEBUG: process_message_batch - 합쳐진 메시지: '{combined_message_content}'")
 
-    current_history, current_likability = load_user_data(user_id)
-    print(f"DEBUG: process_message_batch - 로드됨 -> 기록: {len(current_history)}턴, 호감도: {current_likability}")
+    # 이 묶음의 저장이 끝나기 전에 다음 묶음/명령어가 로드하지 않도록 후처리 자리를 먼저 등록
+    previous_post_process, pending_post_process = reserve_post_processing(user_id)
+    post_process_handed_off = False
+    try:
+        # 이전 묶음의 호감도/기록 저장이 아직 진행 중이면 끝난 뒤에 로드
+        await _wait_for_pending(user_id, previous_post_process)
+        current_history, current_likability = load_user_data(user_id)
+        print(f"DEBUG: process_message_batch - 로드됨 -> 기록: {len(current_history)}턴, 호감도: {current_likability}")
 
-    async with channel.typing():
-        try:
-            # 대화 처리 및 응답 생성
-            bot_response_text_full, final_text_to_send = await generate_response(
-                model, combined_message_content, current_history, current_likability)
-            
-            # 성공 시 호감도 계산
-            new_likability = await calculate_likability(model, current_likability, combined_message_content)
-            
-            # 대화 기록에 추가
-            current_history.append({'role': 'user', 'parts': [combined_message_content]})
-            current_history.append({'role': 'model', 'parts': [bot_response_text_full]})  # 전체 응답 저장
-            
-            # 대화 기록 관리 (최대 길이 제한)
-            current_history = trim_history(current_history)
+        async with channel.typing():
+            try:
+                # 대기 시간 동안 미리 만들어둔 답변이 있으면 사용
+                speculative_response = await take_speculative_reply(
+                    user_id, speculative_task, current_history, current_likability)
+                if speculative_response:
+                    bot_response_text_full, final_text_to_send = speculative_response
+                else:
+                    # 최근 기록에 없는 예전 대화 중 관련 내용 검색
+                    memory_snippets = await long_term_memory.retrieve(user_id, combined_message_content) if config.LONG_TERM_MEMORY_ENABLED else None
+
+                    # 대화 처리 및 응답 생성
+                    bot_response_text_full, final_text_to_send = await generate_response(
+                        router, combined_message_content, current_history, current_likability, memory_snippets)
             
-            # DB에 저장
-            save_user_data(user_id, current_history, new_likability)
-            print(f"DEBUG: 대화 저장 완료 (총 {len(current_history)} 턴), 새 호감도: {new_likability}")
-
-            # 최종 텍스트 분할 전송
-            print(f"DEBUG: process_message_batch - 최종 전송할 텍스트: {final_text_to_send[:100]}...")
-            final_sentences = re.split(r'(?<=[.?!])\s+', final_text_to_send)
-            for sentence in final_sentences:
-                sentence = sentence.strip()
-                if sentence:
-                    await channel.send(sentence)
-                    await asyncio.sleep(random.uniform(1.0, 2.0))
+                # 호감도 계산 및 저장 (백그라운드 설정 시 전송과 동시에 진행)
+                post_process_args = (router, combined_message_content, current_history, current_likability, bot_response_text_full)
+                if config.BACKGROUND_POST_PROCESSING_ENABLED:
+                    schedule_post_processing(user_id, pending_post_process, *post_process_args)
+                    post_process_handed_off = True
+                else:
+                    await run_post_processing(user_id, *post_process_args)
 
-        except Exception as e:
-            print(f"오류: User {user_id} 메시지 처리(요약 포함) 중 - {e}")
-            traceback.print_exc()
-            if not 'final_text_to_send' in locals() or not final_text_to_send:
-                await channel.send("미안, 방금 하신 말씀들을 처리하는 데 문제가 생겼어요. 😥")
+                # 최종 텍스트 분할 전송
+                print(f"DEBUG: process_message_batch - 최종 전송할 텍스트: {final_text_to_send[:100]}...")
+                final_sentences = re.split(r'(?<=[.?!])\s+', final_text_to_send)
+                first_send_seconds = None
+                for sentence in final_sentences:
+                    sentence = sentence.strip()
+                    if sentence:
+                        await channel.send(sentence)
+                        if first_send_seconds is None:
+                            first_send_seconds = time.perf_counter() - batch_started
+                        await asyncio.sleep(random.uniform(1.0, 2.0))
+                if first_send_seconds is not None:
+                    mode = "background" if config.BACKGROUND_POST_PROCESSING_ENABLED else "inline"
+                    record_reply_latency(mode, first_send_seconds, time.perf_counter() - batch_started)
+
+            except Exception as e:
+                print(f"오류: User {user_id} 메시지 처리(요약 포함) 중 - {e}")
+                traceback.print_exc()
+                if not 'final_text_to_send' in locals() or not final_text_to_send:
+                    await channel.send("미안, 방금 하신 말씀들을 처리하는 데 문제가 생겼어요. 😥")
+    finally:
+        if not post_process_handed_off:
+            finish_post_processing(user_id, pending_post_process)
 
     if user_id in user_timer_tasks:
         del user_timer_tasks[user_id]
         print(f"DEBUG: process_message_batch - 타이머 작업 최종 제거됨")
 
-def trim_history(history_list, max_turns=10):
+def trim_history(history_list, max_turns=None):
     """대화 이력이 너무 길면 최근 N턴만 유지합니다"""
+    max_turns = config.HISTORY_MAX_TURNS if max_turns is None else max_turns
     if len(history_list) > max_turns * 2:  # 사용자/봇 메시지 쌍이므로 *2
         return history_list[-max_turns*2:]
     return history_list
@@ -109,11 +311,14 @@ async def handle_new_message(message, bot):
             print(f"DEBUG: 기존 타이머 취소 시도 - 사용자 ID: {user_id}")
             existing_task.cancel()
 
+    if config.SPECULATIVE_REPLY_ENABLED:
+        start_speculative_reply(user_id, bot.model_router)
+
     async def delayed_process(uid):
         try:
             await asyncio.sleep(config.MESSAGE_BATCH_DELAY_SECONDS)
             print(f"DEBUG: {config.MESSAGE_BATCH_DELAY_SECONDS}초 타이머 만료 - 사용자 ID: {uid}, 처리 함수 호출 시도.")
-            await process_message_batch(uid, bot.model, bot.user)
+            await process_message_batch(uid, bot.model_router, bot.user)
         except asyncio.CancelledError:
             print(f"DEBUG: 타이머 작업 정상 취소됨 (새 메시지 수신) - 사용자 ID: {uid}")
         except Exception as e:
@@ -125,6 +330,7 @@ async def handle_new_message(message, bot):
             if uid in user_message_buffers:
                 del user_message_buffers[uid]
                 print(f"DEBUG: 오류 발생 후 메시지 버퍼 정리됨 - 사용자 ID: {uid}")
+            discard_speculative_reply(uid, "처리 오류")
 
     print(f"DEBUG: 새 타이머 시작 ({config.MESSAGE_BATCH_DELAY_SECONDS}초) - 사용자 ID: {user_id}")
     user_timer_tasks[user_id] = asyncio.create_task(delayed_process(user_id))
\ No newline at end of file
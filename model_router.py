@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# model_router.py - 작업(답변/감성 분석/요약/선톡)별 모델 선택
+# config.MODEL_REGISTRY 에 작업별로 허용된 모델 목록이 있고, 그 중 최근 지연시간이 짧고 정상인 모델을 고름
+
+import random
+
+import google.generativeai as genai
+
+import config
+import prompts
+from api_guard import get_breaker, get_model_stats
+
+def _default_model_factory(model_name, system_instruction):
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+class ModelRouter:
+    """작업별 (모델, generation_config) 선택기
+
+    - 지연시간 표본이 MODEL_ROUTER_MIN_SAMPLES 개 미만인 모델은 설정 순서대로 먼저 시도해서 표본을 모음
+    - 서킷이 열렸거나 최근 MODEL_ROUTER_ERROR_WINDOW_SECONDS 초 동안의 오류율이 MODEL_ROUTER_MAX_ERROR_RATE 를 넘는 모델은 제외
+      (제외되면 호출이 없어 통계가 갱신되지 않으므로, 실패 기록이 오래되면 표본 부족으로 보고 다시 시도함)
+    - 지연시간/오류율은 작업·모델별 통계 사용 (같은 모델도 작업마다 응답 길이와 지연시간이 다름)
+    - 나머지 중 지연시간 중앙값이 가장 작은 모델 선택 (가끔 다른 후보도 골라서 통계를 갱신)
+    """
+
+    def __init__(self, registry=None, model_factory=None):
+        self.registry = registry or config.MODEL_REGISTRY
+        self.model_factory = model_factory or _default_model_factory
+        self._models = {}
+
+    def get_model(self, model_name, use_system_instruction=True, persona_band=None):
+        """모델 인스턴스 반환 (이름, 시스템 프롬프트 사용 여부, 호감도 구간별로 한 번만 생성)
+
+        persona_band 가 주어지면 해당 호감도 구간 규칙만 들어간 페르소나(prompts.PERSONA_VARIANTS)를 사용.
+        """
+        if not use_system_instruction:
+            persona_band = None
+        key = (model_name, use_system_instruction, persona_band)
+        if key not in self._models:
+            if not use_system_instruction:
+                system_instruction = None
+            elif persona_band is not None:
+                system_instruction = prompts.PERSONA_VARIANTS[persona_band]
+            else:
+                system_instruction = prompts.SYSTEM_INSTRUCTION
+            self._models[key] = self.model_factory(model_name, system_instruction)
+        return self._models[key]
+
+    def warm_up(self):
+        """설정된 모든 모델을 미리 생성 (설정 오류를 시작 시점에 발견하기 위해)"""
+        for task, candidates in self.registry.items():
+            for entry in candidates:
+                self.get_model(entry["model"], entry.get("system_instruction", True))
+                if config.PERSONA_VARIANTS_ENABLED and entry.get("system_instruction", True):
+                    for persona_band in prompts.PERSONA_VARIANTS:
+                        self.get_model(entry["model"], True, persona_band)
+            print(f"DEBUG: 모델 라우팅 - {task}: {[entry['model'] for entry in candidates]}")
+
+    def _is_healthy(self, model, task):
+        if get_breaker(model).is_open():
+            return False
+        recent_outcomes = get_model_stats(model, task).recent_outcomes(config.MODEL_ROUTER_ERROR_WINDOW_SECONDS)
+        if len(recent_outcomes) < config.MODEL_ROUTER_MIN_SAMPLES:
+            return True
+        return recent_outcomes.count(False) / len(recent_outcomes) <= config.MODEL_ROUTER_MAX_ERROR_RATE
+
+    def select(self, task, persona_band=None):
+        """작업에 사용할 (모델, generation_config dict 또는 None) 반환 (persona_band: 호감도 구간별 페르소나)"""
+        candidates = self.registry.get(task) or self.registry["reply"]
+        routes = [(self.get_model(entry["model"], entry.get("system_instruction", True), persona_band), entry.get("generation_config"))
+                  for entry in candidates]
+
+        healthy = [route for route in routes if self._is_healthy(route[0], task)]
+        if not healthy:
+            # 전부 비정상이면 서킷이 닫힌 것 중 첫 번째, 그것도 없으면 첫 번째 (call_model 이 바로 실패 처리)
+            healthy = [route for route in routes if not get_breaker(route[0]).is_open()] or routes[:1]
+            chosen = healthy[0]
+        else:
+            unsampled = [route for route in healthy if len(get_model_stats(route[0], task).latencies) < config.MODEL_ROUTER_MIN_SAMPLES]
+            if unsampled:
+                chosen = unsampled[0]
+            elif len(healthy) > 1 and random.random() < config.MODEL_ROUTER_EXPLORE_RATE:
+                chosen = random.choice(healthy)
+            else:
+                chosen = min(healthy, key=lambda route: get_model_stats(route[0], task).percentile(0.5))
+
+        if len(routes) > 1:
+            stats = get_model_stats(chosen[0], task)
+            median = stats.percentile(0.5)
+            median_text = f"{median * 1000:.0f}ms" if median is not None else "표본 없음"
+            print(f"DEBUG: 모델 라우팅 - {task} -> {chosen[0].model_name} (지연 중앙값 {median_text}, 오류율 {stats.error_rate(config.MODEL_ROUTER_ERROR_WINDOW_SECONDS) * 100:.0f}%)")
+        return chosen
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# sentiment_batcher.py - 여러 사용자의 감성 분석 요청을 모아서 한 번에 분류하는 마이크로 배치
+
+import asyncio
+import json
+import re
+import time
+import traceback
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import google.generativeai.types as genai_types
+
+import config
+import prompts
+from api_guard import call_model
+
+SENTIMENT_LABELS = ("POSITIVE", "NEGATIVE", "NEUTRAL")
+
+# "1: POSITIVE", "2. neutral", "[3] NEGATIVE" 등 번호 + 라벨 형식의 한 줄
+_BATCH_LINE_PATTERN = re.compile(r'^\s*\[?(\d+)\s*[\]\.:)\-]?\s*(' + '|'.join(SENTIMENT_LABELS) + r')\b', re.IGNORECASE)
+
+async def classify_sentiment_single(model, message_content, generation_config=None):
+    """메시지 하나를 기존 프롬프트로 감성 분석. 응답 문자열(대문자) 반환, 실패 시 None"""
+    generation_config_sentiment = genai_types.GenerationConfig(**(generation_config or config.SENTIMENT_GENERATION_CONFIG))
+    sentiment_prompt = prompts.SENTIMENT_ANALYSIS_PROMPT_TEMPLATE.format(user_message=message_content)
+    print(f"DEBUG: 감성 분석 프롬프트 전송 시도")
+
+    sentiment_response = await call_model(
+        model,
+        sentiment_prompt,
+        generation_config=generation_config_sentiment,
+        task="sentiment"
+    )
+
+    if sentiment_response and sentiment_response.text:
+        return sentiment_response.text.strip().upper()
+    print(f"경고: 감성 분석 API 응답 비었음.")
+    return None
+
+def parse_batch_labels(response_text, item_count):
+    """배치 응답에서 {번호(0부터): 라벨} 추출. 범위 밖 번호나 형식이 틀린 줄은 무시"""
+    labels = {}
+    for line in (response_text or "").splitlines():
+        match = _BATCH_LINE_PATTERN.match(line)
+        if not match:
+            continue
+        index = int(match.group(1)) - 1
+        if 0 <= index < item_count and index not in labels:
+            labels[index] = match.group(2).upper()
+    return labels
+
+class SentimentBatcher:
+    """감성 분석 요청을 최대 max_wait_seconds 동안 또는 max_items 개까지 모아서 한 번에 전송
+
+    classify() 를 부른 쪽은 자기 메시지의 라벨이 나올 때까지 기다리기만 하면 됨.
+    배치 응답에서 라벨을 못 찾은 항목만 기존 단건 요청으로 다시 분류함.
+    배치 호출 자체가 실패하면 재요청 폭증을 막기 위해 모든 항목을 결과 없음(None)으로 돌려줌 (failed_batches 로 집계).
+    """
+
+    def __init__(self, model, generation_config=None, max_wait_seconds=None, max_items=None):
+        self.model = model
+        self.generation_config = generation_config or config.SENTIMENT_GENERATION_CONFIG
+        self.max_wait_seconds = config.SENTIMENT_BATCH_MAX_WAIT_SECONDS if max_wait_seconds is None else max_wait_seconds
+        self.max_items = config.SENTIMENT_BATCH_MAX_ITEMS if max_items is None else max_items
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._batch_tasks = set()  # 실행 중인 배치 작업 (GC 방지용 참조)
+        self._saved_requests = deque()  # (완료 시각, 절약된 요청 수)
+        self.failed_batches = 0  # 호출 자체가 실패해서 전부 결과 없음 처리된 배치 수
+
+    async def classify(self, message_content):
+        """메시지 하나의 감성 라벨(대문자 문자열) 반환, 실패 시 None"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message_content, future))
+
+        if len(self._pending) >= self.max_items:
+            self._flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_wait())
+        return await future
+
+    async def _flush_after_wait(self):
+        await asyncio.sleep(self.max_wait_seconds)
+        self._flush_task = None
+        self._flush()
+
+    def _flush(self):
+        """대기 중인 요청을 꺼내서 배치 작업으로 넘김 (대기 타이머가 있으면 취소)"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        jobs, self._pending = self._pending, []
+        if jobs:
+            task = asyncio.create_task(self._run_batch(jobs))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, jobs):
+        """모인 요청을 하나의 번호 매긴 분류 요청으로 보내고 결과를 각 요청자에게 분배"""
+        labels = {}
+        try:
+            labels = await self._classify_jobs(jobs)
+        except Exception as e:
+            print(f"오류: 감성 분석 배치 처리 중 예외 발생: {e}")
+            traceback.print_exc()
+        finally:
+            # 어떤 경우에도 기다리는 쪽이 멈춰 있지 않도록 결과(실패 시 None)를 넘겨줌
+            for i, (_, future) in enumerate(jobs):
+                if not future.done():
+                    future.set_result(labels.get(i))
+
+    async def _classify_jobs(self, jobs):
+        if len(jobs) == 1:
+            # 1건이면 배치 프롬프트 없이 기존 단건 요청
+            return {0: await classify_sentiment_single(self.model, jobs[0][0], self.generation_config)}
+
+        # 다른 사용자 메시지와 한 프롬프트에 들어가므로 JSON 문자열로 감싸서 따옴표/줄바꿈으로 번호를 흉내 내지 못하게 함
+        numbered_messages = "\n".join(
+            f"{i}. {json.dumps(content, ensure_ascii=False)}" for i, (content, _) in enumerate(jobs, start=1))
+        batch_prompt = prompts.BATCH_SENTIMENT_ANALYSIS_PROMPT_TEMPLATE.format(numbered_messages=numbered_messages)
+        generation_config_batch = genai_types.GenerationConfig(**dict(
+            self.generation_config,
+            max_output_tokens=config.SENTIMENT_BATCH_TOKENS_PER_ITEM * len(jobs)))
+        print(f"DEBUG: 감성 분석 배치 전송 시도 - {len(jobs)}건")
+        try:
+            batch_response = await call_model(
+                self.model,
+                batch_prompt,
+                generation_config=generation_config_batch,
+                task="sentiment"
+            )
+        except Exception as e:
+            # 호출 자체가 실패하면 (시간 초과, 서킷 열림 등) 개별 요청으로 쪼개지 않고 전부 결과 없음 처리
+            # 분류 자체를 못 했으므로 절약한 요청으로 세지 않음
+            self.failed_batches += 1
+            print(f"오류: 감성 분석 배치 API 호출 중 오류 발생: {e}. {len(jobs)}건 모두 호감도 변경 없음. (실패 배치 누적 {self.failed_batches}건)")
+            return {}
+        labels = parse_batch_labels(batch_response.text if batch_response else "", len(jobs))
+        print(f"DEBUG: 감성 분석 배치 결과 - {len(labels)}/{len(jobs)}건 파싱 성공")
+
+        # 응답에서 라벨을 못 찾은 항목만 하나씩 개별 요청
+        missing = [i for i in range(len(jobs)) if i not in labels]
+        fallback_results = await asyncio.gather(
+            *(classify_sentiment_single(self.model, jobs[i][0], self.generation_config) for i in missing), return_exceptions=True)
+        for i, result in zip(missing, fallback_results):
+            if isinstance(result, Exception):
+                print(f"오류: 감성 분석 개별 재시도 중 오류 발생: {result}")
+                result = None
+            labels[i] = result
+
+        self._record_saved(len(jobs) - 1 - len(missing))
+        return labels
+
+    def _record_saved(self, saved):
+        now = time.monotonic()
+        self._saved_requests.append((now, saved))
+        while self._saved_requests and now - self._saved_requests[0][0] > 60:
+            self._saved_requests.popleft()
+        print(f"DEBUG: 감성 분석 배치 - 이번 배치 절약 요청 {saved}건, 최근 1분간 절약 {self.requests_saved_per_minute()}건")
+
+    def requests_saved_per_minute(self):
+        """최근 60초 동안 배치 덕분에 보내지 않은 API 요청 수"""
+        now = time.monotonic()
+        return sum(saved for ts, saved in self._saved_requests if now - ts <= 60)
+
+# 모델별로 배처 하나씩 유지 (같은 모델로 가는 요청끼리만 묶음)
+_batchers: Dict[int, SentimentBatcher] = {}
+
+def get_sentiment_batcher(model, generation_config=None):
+    """모델에 해당하는 배처 반환 (없으면 생성)"""
+    batcher = _batchers.get(id(model))
+    if batcher is None or batcher.model is not model:
+        batcher = SentimentBatcher(model, generation_config)
+        _batchers[id(model)] = batcher
+    return batcher
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# tests/test_api_guard.py - API 호출 제한 시간/중복 요청/재시도/서킷 브레이커 테스트 (가짜 모델 사용)
+
+import asyncio
+import random
+import time
+
+import pytest
+
+pytest.importorskip("google.api_core")
+
+from google.api_core import exceptions as core_exceptions
+
+import api_guard
+import config
+from api_guard import CircuitOpenError, call_model, get_breaker, get_model_stats
+
+class FaultInjectingModel:
+    """generate_content_async 만 흉내 내고 지연/멈춤/오류를 확률적으로 주입하는 가짜 모델
+
+    rolls 를 주면 난수 대신 그 값을 차례로 사용 (어떤 호출이 느릴지 정해두는 용도).
+    """
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, model_name="fault-injecting-model", latency=0.01, slow_rate=0.0, slow_latency=2.0,
+                 hang_rate=0.0, error_rate=0.0, response_text="응 알겠어!", rolls=None, seed=None):
+        self.model_name = model_name
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.hang_rate = hang_rate
+        self.error_rate = error_rate
+        self.response_text = response_text
+        self.calls = 0
+        self._rolls = iter(rolls) if rolls is not None else None
+        self._random = random.Random(seed)
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.calls += 1
+        roll = next(self._rolls) if self._rolls is not None else self._random.random()
+        if roll < self.hang_rate:
+            await asyncio.Event().wait()  # 응답 없이 영원히 대기
+        roll -= self.hang_rate
+        if roll < self.error_rate:
+            await asyncio.sleep(self.latency)
+            raise core_exceptions.ServiceUnavailable("injected fault")
+        roll -= self.error_rate
+        await asyncio.sleep(self.slow_latency if roll < self.slow_rate else self.latency)
+        return self.Response(self.response_text)
+
+@pytest.fixture(autouse=True)
+def guard_config(monkeypatch):
+    # 테스트마다 빈 통계/서킷과 짧은 제한 시간으로 시작 (전역 설정은 monkeypatch 로 되돌림)
+    monkeypatch.setattr(api_guard, "_model_stats", {})
+    monkeypatch.setattr(api_guard, "_breakers", {})
+    monkeypatch.setattr(config, "API_CALL_TIMEOUT_SECONDS", {"reply": 0.2})
+    monkeypatch.setattr(config, "API_CALL_DEADLINE_SECONDS", {"reply": 5})
+    monkeypatch.setattr(config, "API_MAX_RETRIES", 0)
+    monkeypatch.setattr(config, "API_RETRY_BASE_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(config, "API_HEDGING_ENABLED", True)
+    monkeypatch.setattr(config, "API_HEDGE_MIN_SAMPLES", 20)
+    monkeypatch.setattr(config, "API_HEDGE_PERCENTILE", 0.95)
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_RESET_SECONDS", 0.05)
+
+def timed(coro):
+    """코루틴 실행 후 (결과 또는 예외, 걸린 시간) 반환"""
+    async def run():
+        start = time.perf_counter()
+        try:
+            result = await coro
+        except Exception as e:
+            result = e
+        return result, time.perf_counter() - start
+    return asyncio.run(run())
+
+def test_hang_hits_per_attempt_timeout():
+    model = FaultInjectingModel("hang-once", hang_rate=1.0)
+
+    result, elapsed = timed(call_model(model, "안녕"))
+
+    assert isinstance(result, asyncio.TimeoutError)
+    assert model.calls == 1
+    assert 0.2 <= elapsed < 0.4
+
+def test_overall_deadline_bounds_all_retries(monkeypatch):
+    monkeypatch.setattr(config, "API_MAX_RETRIES", 5)
+    monkeypatch.setattr(config, "API_CALL_DEADLINE_SECONDS", {"reply": 0.5})
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_FAILURE_THRESHOLD", 100)
+    model = FaultInjectingModel("hang-always", hang_rate=1.0)
+
+    result, elapsed = timed(call_model(model, "안녕"))
+
+    # 시도당 0.2초 x 6회가 아니라 전체 0.5초 안에서 끝나야 함 (0.2 + 0.2 + 남은 0.1)
+    assert isinstance(result, asyncio.TimeoutError)
+    assert model.calls == 3
+    assert 0.5 <= elapsed < 0.7
+
+def test_hedge_is_sent_after_p95_and_first_success_wins(monkeypatch):
+    monkeypatch.setattr(config, "API_CALL_TIMEOUT_SECONDS", {"reply": 2.0})
+    model = FaultInjectingModel("hedged", latency=0.01, slow_rate=0.5, slow_latency=1.5, rolls=[0.0, 0.9])
+    stats = get_model_stats(model, "reply")
+    for _ in range(20):
+        stats.record_success(0.05)
+
+    result, elapsed = timed(call_model(model, "안녕"))
+
+    assert result.text == "응 알겠어!"
+    assert model.calls == 2
+    assert stats.hedges == 1
+    assert elapsed < 0.5  # 느린 첫 요청(1.5초)을 기다리지 않음
+
+def test_hedge_threshold_uses_stats_of_the_same_task(monkeypatch):
+    monkeypatch.setattr(config, "API_CALL_TIMEOUT_SECONDS", {"reply": 2.0, "sentiment": 2.0})
+    model = FaultInjectingModel("per-task", latency=0.2)
+    for _ in range(20):
+        get_model_stats(model, "sentiment").record_success(0.01)
+
+    timed(call_model(model, "안녕", task="reply"))
+
+    # 감성 분석 통계(10ms)로 답변 생성 요청을 중복 전송하지 않아야 함
+    assert model.calls == 1
+    assert get_model_stats(model, "reply").hedges == 0
+
+def test_circuit_opens_after_threshold():
+    model = FaultInjectingModel("down", error_rate=1.0)
+
+    errors = [timed(call_model(model, "안녕"))[0] for _ in range(4)]
+
+    assert all(isinstance(e, core_exceptions.ServiceUnavailable) for e in errors[:3])
+    assert isinstance(errors[3], CircuitOpenError)
+    assert model.calls == 3
+
+def test_breaker_half_opens_and_closes_after_successful_probe():
+    model = FaultInjectingModel("recovering", error_rate=1.0, latency=0.05)
+    for _ in range(3):
+        timed(call_model(model, "안녕"))
+    breaker = get_breaker(model)
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    model.error_rate = 0.0
+
+    async def probe_with_concurrent_call():
+        probe = asyncio.create_task(call_model(model, "안녕"))
+        await asyncio.sleep(0.01)
+        # 시험 호출이 끝나기 전의 다른 호출은 바로 거절
+        with pytest.raises(CircuitOpenError):
+            await call_model(model, "안녕")
+        return await probe
+
+    assert asyncio.run(probe_with_concurrent_call()).text == "응 알겠어!"
+    assert breaker.state == "closed"
+    assert model.calls == 4
+
+def test_cancelled_probe_releases_half_open_slot():
+    model = FaultInjectingModel("cancelled-probe", error_rate=1.0)
+    for _ in range(3):
+        timed(call_model(model, "안녕"))
+    breaker = get_breaker(model)
+    time.sleep(0.06)
+    model.error_rate = 0.0
+    model.hang_rate = 1.0
+
+    async def cancel_probe():
+        probe = asyncio.create_task(call_model(model, "안녕"))
+        await asyncio.sleep(0.01)
+        assert breaker.is_open()  # 시험 호출 진행 중
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+
+    assert breaker.state == "half_open"
+    assert not breaker.is_open()
+    model.hang_rate = 0.0
+    assert timed(call_model(model, "안녕"))[0].text == "응 알겠어!"
+    assert breaker.state == "closed"
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# tests/test_database.py - 저장소 백엔드 공통 인터페이스 규약 테스트 (SQLite / PostgreSQL)
+
+import os
+
+import pytest
+
+import config
+import database
+
+TEST_USER_ID = -1  # 실제 디스코드 사용자 ID 와 겹치지 않는 값
+HISTORY = [{'role': 'user', 'parts': ['안녕 😊']}, {'role': 'model', 'parts': ['응 안녕!']}]
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        storage = database.SQLiteStorage(str(tmp_path / "test.sqlite3"))
+    else:
+        if database.psycopg2 is None or not os.getenv('DATABASE_URL'):
+            pytest.skip("PostgreSQL 테스트에는 psycopg2 와 DATABASE_URL 이 필요함")
+        storage = database.PostgresStorage()
+    storage.init_db()
+    storage.delete_user_data(TEST_USER_ID)
+    yield storage
+    storage.delete_user_data(TEST_USER_ID)
+    if request.param == "sqlite":
+        storage.close()
+
+def test_unknown_user_returns_defaults(backend):
+    assert backend.load_user_data(TEST_USER_ID) == ([], config.DEFAULT_LIKABILITY_SCORE)
+
+def test_save_then_load_round_trips(backend):
+    backend.save_user_data(TEST_USER_ID, HISTORY, 55)
+    assert backend.load_user_data(TEST_USER_ID) == (HISTORY, 55)
+
+def test_save_overwrites_existing_row(backend):
+    backend.save_user_data(TEST_USER_ID, HISTORY, 55)
+    backend.save_user_data(TEST_USER_ID, HISTORY[:1], 60)
+    assert backend.load_user_data(TEST_USER_ID) == (HISTORY[:1], 60)
+
+def test_get_all_user_ids_tracks_saves_and_deletes(backend):
+    backend.save_user_data(TEST_USER_ID, HISTORY, 55)
+    assert TEST_USER_ID in backend.get_all_user_ids()
+    backend.delete_user_data(TEST_USER_ID)
+    assert TEST_USER_ID not in backend.get_all_user_ids()
+
+def test_init_db_is_idempotent(backend):
+    backend.save_user_data(TEST_USER_ID, HISTORY, 55)
+    backend.init_db()
+    assert backend.load_user_data(TEST_USER_ID) == (HISTORY, 55)
+
+def test_storage_backend_is_abstract():
+    with pytest.raises(TypeError):
+        database.StorageBackend()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# tests/test_sentiment_batcher.py - 감성 분석 마이크로 배치: 응답 파싱과 라벨 분배 테스트
+
+import asyncio
+import json
+import re
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("google.api_core")
+
+import api_guard
+import prompts
+from sentiment_batcher import SentimentBatcher, parse_batch_labels
+
+class ScriptedModel:
+    """프롬프트를 보고 응답 텍스트를 돌려주는 가짜 모델 (batch_reply/single_reply 가 예외면 그대로 발생)"""
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, model_name, batch_reply, single_reply="NEUTRAL"):
+        self.model_name = model_name
+        self.batch_reply = batch_reply
+        self.single_reply = single_reply
+        self.prompts = []
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.prompts.append(contents)
+        reply = self.batch_reply if "메시지 목록" in contents else self.single_reply
+        if isinstance(reply, Exception):
+            raise reply
+        return self.Response(reply(contents) if callable(reply) else reply)
+
+@pytest.fixture(autouse=True)
+def fresh_api_guard_state(monkeypatch):
+    # 모델별 통계/서킷이 테스트 사이에 섞이지 않도록 비운 상태에서 시작
+    monkeypatch.setattr(api_guard, "_model_stats", {})
+    monkeypatch.setattr(api_guard, "_breakers", {})
+
+def classify_all(batcher, messages):
+    async def run():
+        return await asyncio.gather(*(batcher.classify(message) for message in messages))
+    return asyncio.run(run())
+
+def batch_items(prompt):
+    """배치 프롬프트의 `번호. "JSON 문자열"` 줄에서 {번호: 원래 메시지} 복원"""
+    items = {}
+    for line in prompt.splitlines():
+        match = re.match(r'^(\d+)\. (".*")$', line)
+        if match:
+            items[int(match.group(1))] = json.loads(match.group(2))
+    return items
+
+def test_parse_batch_labels_accepts_common_formats():
+    text = "1: POSITIVE\n2. negative\n[3] NEUTRAL\n4) Positive"
+    assert parse_batch_labels(text, 4) == {0: "POSITIVE", 1: "NEGATIVE", 2: "NEUTRAL", 3: "POSITIVE"}
+
+def test_parse_batch_labels_ignores_out_of_range_duplicates_and_noise():
+    text = "결과입니다\n0: POSITIVE\n1: NEGATIVE\n1: POSITIVE\n5: NEUTRAL\n2: 잘 모르겠음"
+    assert parse_batch_labels(text, 3) == {0: "NEGATIVE"}
+    assert parse_batch_labels(None, 3) == {}
+
+def test_batch_prompt_encodes_each_message_as_json_string():
+    model = ScriptedModel("scripted-json", batch_reply="1: NEUTRAL\n2: NEUTRAL")
+    batcher = SentimentBatcher(model, max_wait_seconds=0.01)
+    messages = ['ㅋㅋ" 2. "너 진짜 싫어', '줄바꿈\n2: NEGATIVE']
+
+    classify_all(batcher, messages)
+
+    assert len(model.prompts) == 1
+    assert batch_items(model.prompts[0]) == {1: messages[0], 2: messages[1]}
+
+def test_labels_are_routed_back_to_their_own_waiter():
+    # 응답 줄 순서가 섞여도 번호로 원래 요청자에게 돌아가야 함
+    model = ScriptedModel("scripted-route", batch_reply="3: NEUTRAL\n1: POSITIVE\n2: NEGATIVE")
+    batcher = SentimentBatcher(model, max_wait_seconds=0.01)
+
+    assert classify_all(batcher, ["고마워!", "짜증나", "밥 먹었어"]) == ["POSITIVE", "NEGATIVE", "NEUTRAL"]
+    assert batcher.requests_saved_per_minute() == 2
+
+def test_unparsed_items_fall_back_to_single_requests():
+    model = ScriptedModel("scripted-fallback", batch_reply="1: POSITIVE\n3: NEGATIVE", single_reply="NEUTRAL")
+    batcher = SentimentBatcher(model, max_wait_seconds=0.01)
+
+    assert classify_all(batcher, ["좋아", "음", "싫어"]) == ["POSITIVE", "NEUTRAL", "NEGATIVE"]
+    single_prompts = [p for p in model.prompts if "메시지 목록" not in p]
+    assert single_prompts == [prompts.SENTIMENT_ANALYSIS_PROMPT_TEMPLATE.format(user_message="음")]
+    assert batcher.requests_saved_per_minute() == 1
+
+def test_failed_batch_call_resolves_every_item_to_none_without_fan_out():
+    model = ScriptedModel("scripted-failure", batch_reply=ValueError("bad request"))
+    batcher = SentimentBatcher(model, max_wait_seconds=0.01)
+
+    assert classify_all(batcher, ["a", "b", "c"]) == [None, None, None]
+    assert len(model.prompts) == 1
+    assert batcher.failed_batches == 1
+    assert batcher.requests_saved_per_minute() == 0
+
+def test_single_item_uses_single_prompt():
+    model = ScriptedModel("scripted-single", batch_reply="1: NEGATIVE", single_reply="positive")
+    batcher = SentimentBatcher(model, max_wait_seconds=0.01)
+
+    assert classify_all(batcher, ["안녕"]) == ["POSITIVE"]
+    assert all("메시지 목록" not in p for p in model.prompts)
@@ -13,6 +13,7 @@ import config
 import prompts
 from database import get_all_user_ids, load_user_data, save_user_data
 from ai_service import generate_proactive_message
+from message_handler import wait_for_post_processing
 
 async def send_proactive_message(bot):
     """선톡 보내는 함수 - 선택된 사용자에게 자동 메시지 발송"""
@@ -42,12 +43,12 @@ async def send_proactive_message(bot):
             
         print(f"선톡 대상 확인: {user.name} ({chosen_user_id})")
         
-        # 사용자 데이터 로드
-        target_user_history, target_user_likability = load_user_data(chosen_user_id)
+        # 진행 중인 대화 후처리가 있으면 끝난 뒤에 생성 (생성 시 최신 기록/호감도를 보도록)
+        await wait_for_post_processing(chosen_user_id)
         
         # Gemini 메시지 생성
         message_to_send_full, final_text_to_send = await generate_proactive_message(
-            bot.model, chosen_user_id, user.display_name)
+            bot.model_router, chosen_user_id, user.display_name)
         
         # 메시지 생성 실패 시 기본 메시지 사용
         if not message_to_send_full:
@@ -66,7 +67,10 @@ async def send_proactive_message(bot):
             
             print(f"선톡 성공 (분할 전송 완료) -> User ID: {chosen_user_id}")
             
-            # DB에 저장
+            # DB에 저장: 생성/전송하는 동안 끝난 대화 저장을 덮어쓰지 않도록 그 사이 후처리를 기다린 뒤 다시 로드
+            # (로드부터 저장까지 await 가 없으므로 그 사이에 다른 묶음의 저장이 끼어들 수 없음)
+            await wait_for_post_processing(chosen_user_id)
+            target_user_history, target_user_likability = load_user_data(chosen_user_id)
             final_history_to_save = target_user_history
             final_history_to_save.append({'role': 'model', 'parts': [message_to_send_full]})
             save_user_data(chosen_user_id, final_history_to_save, target_user_likability)